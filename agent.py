@@ -1,23 +1,41 @@
-from typing import Dict, Any, Callable, Tuple, Optional
+from typing import Dict, Any, Callable, Tuple, Optional, List
+from dataclasses import dataclass, field
 import os
 from dotenv import load_dotenv
 from openai import OpenAI
-import boto3
 import json
 import uuid
 import traceback
+import time
 from utils.vector_db import VectorDB, VectorDBConfig
 from utils.add_to_cart import add_to_cart
 from utils.shipment_details import shipment_details
 from utils.complete_purchase import complete_purchase
 from utils.calculate_total_price import calculate_total_price
 from utils.get_order_details import get_order_details
-from schemas import Get_Product_Recommendations, Add_To_Cart, Shipment_Details, Calculate_Total_Price, Complete_Purchase, Get_Order_Details
+from schemas import Get_Product_Recommendations, Add_To_Cart, Shipment_Details, Calculate_Total_Price, Complete_Purchase, Get_Order_Details, action_adapter
 from utils.logger import CustomLogger
 from utils.tools import ToolRegistry
+from utils.cart import CartStore
+from utils.gazetteer import Gazetteer
+from utils.speculation import Speculator, Speculation
+from utils.metrics import tracer
+from utils.usage import llm_cost, turn_usage, add_to_totals, SESSION_TOTALS
+from utils.aws_clients import get_client
 
 logger = CustomLogger("agent")
 
+# Tools whose input is collected by the UI, the LLM's call is handed back to the client
+UI_TOOLS = ("complete_purchase",)
+# Tools run on the server that fall back to the UI when they return None
+UI_FALLBACK_TOOLS = ("shipment_details",)
+# What the user said by pressing each UI action's button, recorded in the session
+ACTION_QUERIES = {
+    "calculate_total": "Calculate total cost!",
+    "add_items": "Add items!",
+    "complete_purchase": "Complete Purchase",
+}
+
 
 def initialize_tools(*args, **kwargs) -> ToolRegistry:
     """Initialize and configure all tools"""
@@ -30,7 +48,11 @@ def initialize_tools(*args, **kwargs) -> ToolRegistry:
     vector_db = VectorDB(config)
     
     # Create and register tools
+    dynamodb = get_client('dynamodb')
     tools = ToolRegistry()
+    tools.add_resource("dynamodb", dynamodb)
+    tools.add_resource("cart", CartStore(dynamodb, catalog=vector_db))
+    tools.add_resource("gazetteer", Gazetteer())
     tools.register(vector_db.get_product_recommendations, Get_Product_Recommendations)
     tools.register(add_to_cart, Add_To_Cart)
     tools.register(shipment_details, Shipment_Details)
@@ -41,84 +63,311 @@ def initialize_tools(*args, **kwargs) -> ToolRegistry:
     return tools
 
 
+@dataclass
+class TurnContext:
+    """Per-request state of a single agent turn, never shared between requests"""
+    session_id: str
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    tools_used: List[Dict[str, Any]] = field(default_factory=list)
+    deadline: Optional[float] = None
+    speculation: Optional[Speculation] = None
+    # Running usage totals of the session, and the prompt size of its latest LLM call
+    usage_totals: Dict[str, float] = field(default_factory=dict)
+    last_prompt_tokens: int = 0
+
+
 class Agent:
-    def __init__(self, *args, **kwargs):
+    """
+    ReAct agent serving turns for many sessions.
+
+    Everything kept on the instance (tool registry, clients, prompt, limits)
+    is set up once and only read afterwards, and all per-turn state lives in
+    a TurnContext, so one Agent can serve concurrent requests from threads.
+    """
+    def __init__(self, tools: Optional[ToolRegistry] = None, client: Any = None, dynamodb: Any = None):
         try:
-            self.tools = initialize_tools()
-            self.tool_schema = self.tools.get_all_tool_schemas()
+            self.tools = tools if tools is not None else initialize_tools()
+            self.tools.freeze()
+            # Built once, so the tool definitions sent with every call stay byte-identical
+            self.tool_schema = tuple(self.tools.get_all_tool_schemas())
         
-            self.client = OpenAI(
+            self.client = client if client is not None else OpenAI(
                 api_key = os.getenv('OPENAI_API_KEY')
             )
+            # The primary/fallback model loop is the retry policy, client retries would
+            # run each deadline-bounded attempt up to three times
+            if hasattr(self.client, "with_options"):
+                self.client = self.client.with_options(max_retries=0)
         except Exception as e:
-            logger.log_trace(f"Error initializing agent: {str(e)}", level="ERROR")
+            logger.log_trace("Error initializing agent: %s", e, level="ERROR")
             traceback.print_exc()
             raise e
-        # self.messages_file = "session_messages.json"
         self.prompt_file_path = os.path.join(os.path.dirname(__file__), 'prompts', "react_prompt.txt")
         with open(self.prompt_file_path, 'r') as file:
             self.system_prompt = file.read()
         self.model = "gpt-4o-mini"
         self.fallback_model = "gpt-4o" if self.model == "gpt-4o-mini" else "gpt-4o-mini"
-        self.dynamodb = boto3.client('dynamodb')
+        self.dynamodb = dynamodb if dynamodb is not None else get_client('dynamodb')
+        # Bounds on a single turn: LLM rounds, time reserved for saving the
+        # session, and the least time worth starting another LLM call with
+        self.max_steps = int(os.getenv("AGENT_MAX_STEPS", 8))
+        self.deadline_margin = float(os.getenv("AGENT_DEADLINE_MARGIN_MS", 2000)) / 1000
+        self.min_llm_seconds = float(os.getenv("AGENT_MIN_LLM_SECONDS", 3))
+        # Per-session token limits, 0 disables: total tokens after which LLM turns are refused,
+        # and the prompt size after which older history is dropped before the next turn
+        self.session_token_budget = int(os.getenv("SESSION_TOKEN_BUDGET", 0))
+        self.compact_prompt_tokens = int(os.getenv("SESSION_COMPACT_PROMPT_TOKENS", 0))
+        self.compact_keep_messages = int(os.getenv("SESSION_COMPACT_KEEP_MESSAGES", 12))
+        # Product searches started alongside the first LLM call, see utils/speculation.py
+        self.speculator = None
+        if os.getenv("AGENT_SPECULATIVE_RETRIEVAL", "true").lower() == "true":
+            self.speculator = Speculator(workers=int(os.getenv("AGENT_SPECULATION_WORKERS", 4)))
 
-    def __call_llm(self, messages: Dict[str, Any], model: str = "gpt-4o-mini") -> Any:
-        """Call LLM with messages and return response"""
-        try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages = messages,
-                tools=self.tool_schema,
-                tool_choice="auto",
-                temperature=0,
-                parallel_tool_calls=True
-            )
+    def __time_left(self, deadline: Optional[float]) -> float:
+        """Seconds left before the turn deadline"""
+        if deadline is None:
+            return float("inf")
+        return deadline - time.monotonic()
 
-            return response
-        except Exception as e:
-            logger.log_trace(f"Error calling LLM: {str(e)}", level="WARNING")
-            logger.log_trace(f"Ussing fallback model: {self.fallback_model}", level="WARNING")
+    def __call_llm(self, messages: Dict[str, Any], deadline: Optional[float] = None) -> Any:
+        """Call LLM with messages and return response, retrying once with the fallback model"""
+        models = [self.model, self.fallback_model]
+        for attempt, model in enumerate(models):
+            time_left = self.__time_left(deadline)
             try:
-                return self.__call_llm(messages, model=self.fallback_model)
+                with tracer.span("llm", model=model):
+                    response = self.client.chat.completions.create(
+                        model=model,
+                        messages = messages,
+                        tools=self.tool_schema,
+                        tool_choice="auto",
+                        temperature=0,
+                        parallel_tool_calls=True,
+                        timeout=None if deadline is None else time_left
+                    )
+
+                self.__record_usage(response, model)
+                return response
             except Exception as e:
-                logger.log_trace(f"Error calling fallback LLM: {str(e)}", level="ERROR")
-                traceback.print_exc()
-                raise e
-    
-    def __decide(self):
-        """Decide and generate LLM Response"""
-        response_message = self.__call_llm(self.messages).choices[0].message
-        content = response_message.content
-        tool_calls = response_message.tool_calls
-        if content:
-            logger.log_trace(f"Response from LLM: {content}", level="DEBUG")
-            return content
-        elif tool_calls:
+                last_attempt = attempt == len(models) - 1
+                if last_attempt or self.__time_left(deadline) < self.min_llm_seconds:
+                    logger.log_trace("Error calling LLM %s: %s", model, e, level="ERROR")
+                    traceback.print_exc()
+                    raise e
+                tracer.incr("llm_fallbacks")
+                logger.log_trace("Error calling LLM: %s", e, level="WARNING")
+                logger.log_trace("Using fallback model: %s", models[attempt + 1], level="WARNING")
+
+    def __record_usage(self, response: Any, model: str) -> None:
+        """Report token usage and cost, including prompt tokens served from the provider's prefix cache"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        tracer.incr("llm_prompt_tokens", usage.prompt_tokens)
+        tracer.incr("llm_completion_tokens", usage.completion_tokens)
+        tracer.incr("llm_cached_tokens", cached_tokens)
+        tracer.incr("llm_cost_usd", llm_cost(model, usage.prompt_tokens, cached_tokens, usage.completion_tokens))
+        logger.log_trace("LLM usage: prompt=%s cached=%s completion=%s", usage.prompt_tokens, cached_tokens, usage.completion_tokens, level="DEBUG")
+
+    def __partial_answer(self, turn: TurnContext) -> str:
+        """Answer with whatever the tools produced when the turn has to stop early"""
+        message = "I'm sorry, I couldn't finish working on your request in time."
+        if turn.tools_used:
+            message += " Here is what I found so far:\n\n" + str(turn.tools_used[-1]["tool_output"])
+        else:
+            message += " Please try again."
+        return message
+
+    def __call_tool(self, turn: TurnContext, name: str, args: Dict[str, Any]) -> Any:
+        """Run a tool, using the turn's speculative result when it answers the same call"""
+        if turn.speculation is not None:
+            timeout = None if turn.deadline is None else max(self.__time_left(turn.deadline), 0)
+            result = turn.speculation.claim(name, args, timeout=timeout)
+            if result is not None:
+                return result
+        return self.tools.call_function(name, args, session_id=turn.session_id)
+
+    def __decide(self, turn: TurnContext):
+        """Decide and generate LLM Response, running tool calls until the LLM answers"""
+        deadline = turn.deadline
+        for step in range(self.max_steps):
+            if self.__time_left(deadline) < self.min_llm_seconds:
+                tracer.incr("deadline_exits")
+                logger.log_trace("Turn deadline reached after %s steps", step, level="WARNING")
+                return self.__partial_answer(turn)
+
+            tracer.incr("llm_steps")
+            try:
+                response = self.__call_llm(turn.messages, deadline)
+            except Exception:
+                if self.__time_left(deadline) < self.min_llm_seconds:
+                    tracer.incr("deadline_exits")
+                    return self.__partial_answer(turn)
+                raise
+            if getattr(response, "usage", None) is not None:
+                turn.last_prompt_tokens = response.usage.prompt_tokens
+            response_message = response.choices[0].message
+            content = response_message.content
+            tool_calls = response_message.tool_calls
+            if content:
+                logger.log_trace("Response from LLM: %s", content, level="DEBUG")
+                return content
+            elif not tool_calls:
+                # Nothing timed out, the model just gave no answer
+                tracer.incr("empty_replies")
+                logger.log_trace("LLM returned neither content nor tool calls", level="WARNING")
+                return "I'm sorry, I couldn't come up with an answer to that. Could you rephrase your request?"
+
+            # One assistant message per step, holding every tool call of the step
+            turn.messages.append({"role": "assistant", "tool_calls": [tc.model_dump() for tc in tool_calls]})
+            ui_call = None
             for tool_call in tool_calls:
                 name = tool_call.function.name.lower()
                 tool_call_id = tool_call.id
                 args = json.loads(tool_call.function.arguments)
-                self.messages.append({"role": "assistant", "tool_calls": [tool_call.model_dump()]})
-                logger.log_trace(f"Tool called: {name} with arguments: {args}", level="DEBUG")
-                ### Logic for inputs from UI
-                if name == "shipment_details" or name == "complete_purchase":
-                    return {"tool_call_id": tool_call_id,"name": name, "args": args}
-                result = self.tools.call_function(name, args)# call_function(name, args)
-                self.tools_used.append({"tool_call_id": tool_call_id,"name": name, "args": args, "tool_output": result})
-                logger.log_trace(f"Response from tool {name}: {result}", level="DEBUG")
-                self.messages.append({
+                logger.log_trace("Tool called: %s with arguments: %s", name, args, level="DEBUG")
+                result = None
+                if name not in UI_TOOLS:
+                    result = self.__call_tool(turn, name, args)
+                ### Logic for inputs from UI, the UI posts the tool result back later
+                if name in UI_TOOLS or (name in UI_FALLBACK_TOOLS and result is None):
+                    if ui_call is None:
+                        if name == "complete_purchase":
+                            # The UI shows the amount to pay, priced from a fresh read of the server-side cart
+                            args = self.tools.get_resource("cart").quote(turn.session_id)
+                        ui_call = {"tool_call_id": tool_call_id,"name": name, "args": args}
+                        continue
+                    result = f"{name} was not run, only one checkout step can be handled at a time. Call it again once the current step completes."
+                else:
+                    turn.tools_used.append({"tool_call_id": tool_call_id,"name": name, "args": args, "tool_output": result})
+                logger.log_trace("Response from tool %s: %s", name, result, level="DEBUG")
+                turn.messages.append({
                     "role": "tool",
                     "tool_call_id": tool_call_id,
                     "content": str(result)
                 })
-            return self.__decide()
-        
-    def __get_session_messages(self, session_id: str):
-        """Get all messages from DDB"""
-        response = self.dynamodb.get_item(
-                        TableName='sessions',
-                        Key={'session_id': {'S': session_id}}
-                        )
+            if ui_call:
+                return ui_call
+        else:
+            tracer.incr("max_steps_exits")
+            logger.log_trace("Stopped after reaching the limit of %s LLM steps", self.max_steps, level="WARNING")
+
+        return self.__partial_answer(turn)
+
+    def __pending_tool_call(self, turn: TurnContext, tool_call_id: str) -> Optional[str]:
+        """Name of the tool of a call in the session that has no result yet"""
+        answered = {m["tool_call_id"] for m in turn.messages if m["role"] == "tool"}
+        for message in reversed(turn.messages):
+            for tool_call in message.get("tool_calls") or []:
+                if tool_call["id"] == tool_call_id and tool_call_id not in answered:
+                    return tool_call["function"]["name"]
+        return None
+
+    def __pending_call_of(self, turn: TurnContext, name: str) -> Optional[str]:
+        """Id of the latest call to the tool in the session that has no result yet"""
+        answered = {m["tool_call_id"] for m in turn.messages if m["role"] == "tool"}
+        for message in reversed(turn.messages):
+            for tool_call in message.get("tool_calls") or []:
+                if tool_call["function"]["name"] == name and tool_call["id"] not in answered:
+                    return tool_call["id"]
+        return None
+
+    def __record_tool_call(self, turn: TurnContext, name: str, args: Dict[str, Any], result: Any,
+                           tool_call_id: Optional[str] = None) -> None:
+        """Add a tool call and its result to the session, as if the LLM had made the call"""
+        if tool_call_id is None:
+            tool_call_id = f"call_{uuid.uuid4().hex[:24]}"
+            turn.messages.append({"role": "assistant", "tool_calls": [{
+                "id": tool_call_id,
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps(args)}
+            }]})
+        turn.messages.append({"role": "tool", "tool_call_id": tool_call_id, "content": str(result)})
+        turn.tools_used.append({"tool_call_id": tool_call_id,"name": name, "args": args, "tool_output": result})
+
+    def __run_action(self, turn: TurnContext, action: Any) -> str:
+        """
+        Serve a UI button without asking the LLM what to do. The tool runs
+        directly and its call is written to the session, so later turns
+        see the same conversation they would have after an LLM decision.
+        """
+        if isinstance(action, dict):
+            action = action_adapter.validate_python(action)
+        tracer.incr("ui_actions")
+        cart = self.tools.get_resource("cart")
+        pending = self.__pending_tool_call(turn, action.tool_call_id) if action.tool_call_id else None
+        if action.tool_call_id and pending is None:
+            logger.log_trace("Ignoring unknown or answered tool call %s", action.tool_call_id, level="WARNING")
+
+        if action.type == "complete_purchase":
+            # Without the call's id, answer the LLM's latest unanswered complete_purchase call
+            tool_call_id = action.tool_call_id if pending == "complete_purchase" else self.__pending_call_of(turn, "complete_purchase")
+            if tool_call_id is None:
+                turn.messages.append({"role": "user", "content": ACTION_QUERIES[action.type]})
+            result = self.tools.call_function("complete_purchase", {}, session_id=turn.session_id)
+            self.__record_tool_call(turn, "complete_purchase", {}, result, tool_call_id)
+            return result
+
+        # Shipment details the UI worked out for a destination the server couldn't resolve
+        if action.shipment_distance is not None:
+            cart.set_shipment(turn.session_id, action.shipment_distance, action.destination)
+        distance_unknown = pending == "shipment_details" and action.shipment_distance is None
+        destination = action.destination or "the destination"
+        if pending == "shipment_details":
+            if distance_unknown:
+                result = f"The shipment needs to be delivered to {destination}, but the distance could not be calculated. Ask the user for a nearby city to deliver to."
+            else:
+                result = f"The shipment needs to be delivered to {destination}. The calculated distance: {action.shipment_distance:.2f} km."
+            turn.messages.append({"role": "tool", "tool_call_id": action.tool_call_id, "content": result})
+        turn.messages.append({"role": "user", "content": ACTION_QUERIES[action.type]})
+
+        if action.type == "add_items":
+            return "Sure! What else would you like to add to your cart?"
+        if distance_unknown:
+            # Never total the cart with the distance of an earlier destination
+            return f"I couldn't work out the shipment distance to {destination}. Could you tell me a nearby city to deliver to?"
+
+        result = self.tools.call_function("calculate_total_price", {"shipment_distance": None}, session_id=turn.session_id)
+        self.__record_tool_call(turn, "calculate_total_price", {"shipment_distance": None}, result)
+        # Served from the fresh read calculate_total_price just made
+        quote = cart.quote(turn.session_id, fresh=False)
+        if not quote["cart_items"] or quote["shipment_distance"] is None:
+            return result
+        lines = [f"- {item['product_name'] or item['product_id']} x {item['quantity']}: ${item['line_total']:.2f}" for item in quote["cart_items"]]
+        lines.append(f"- Delivery to {quote['destination'] or 'your destination'} ({quote['shipment_distance']:.0f} km): ${quote['shipment_cost']:.2f}")
+        return "Here is your order summary:\n\n" + "\n".join(lines) + f"\n\n**Total: ${quote['total_price']:.2f}**\n\nLet me know when you'd like to complete the purchase."
+
+    def __over_budget(self, turn: TurnContext) -> bool:
+        """Whether the session has used up its token budget"""
+        used = turn.usage_totals.get("prompt_tokens", 0) + turn.usage_totals.get("completion_tokens", 0)
+        return bool(self.session_token_budget) and used >= self.session_token_budget
+
+    def __compact_history(self, turn: TurnContext) -> None:
+        """
+        Drop the oldest exchanges once prompts grow too large, keeping the
+        system prompt and the recent messages from a user message on, so no
+        tool result loses its call. The cart lives outside the history.
+        """
+        starts = [i for i, message in enumerate(turn.messages) if message["role"] == "user"]
+        if not starts:
+            return
+        keep_from = next((i for i in starts if len(turn.messages) - i <= self.compact_keep_messages), starts[-1])
+        head = turn.messages[:1] if turn.messages[0]["role"] == "system" else []
+        if keep_from <= len(head):
+            return
+        tracer.incr("history_compactions")
+        logger.log_trace("Compacting session %s, dropping %s messages", turn.session_id, keep_from - len(head), level="INFO")
+        turn.messages = head + turn.messages[keep_from:]
+
+    def __get_session_messages(self, session_id: str) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+        """Get all messages and the usage totals of the session from DDB"""
+        with tracer.span("session_load"):
+            response = self.dynamodb.get_item(
+                            TableName='sessions',
+                            Key={'session_id': {'S': session_id}}
+                            )
     
         # Extract messages
         item = response.get('Item', {})
@@ -143,14 +392,15 @@ class Agent:
                 
                 messages.append(parsed_message)
 
-        return messages
+        usage = {name: json.loads(value['N']) for name, value in item.get('usage', {}).get('M', {}).items()}
+        return messages, usage
 
-    def __save_session_messages(self, session_id: str):
+    def __save_session_messages(self, turn: TurnContext):
         """Save all messages to DDB"""
         try:
             serialized_messages = []
             
-            for msg in self.messages:
+            for msg in turn.messages:
                 message_item = {'M': {'role': {'S': msg['role']}}}
 
                 # If 'content' exists, store it
@@ -170,53 +420,101 @@ class Agent:
                 serialized_messages.append(message_item)
             
             # Insert/Update the item in DynamoDB
-            self.dynamodb.put_item(
-                TableName='sessions',
-                Item={
-                    'session_id': {'S': session_id},
-                    'messages': {'L': serialized_messages}
-                }
-            )
-            logger.log_trace(f"Session messages saved successfully", level="DEBUG")
+            with tracer.span("session_save", messages=len(serialized_messages)):
+                self.dynamodb.put_item(
+                    TableName='sessions',
+                    Item={
+                        'session_id': {'S': turn.session_id},
+                        'messages': {'L': serialized_messages},
+                        'usage': {'M': {
+                            name: {'N': str(value)}
+                            for name, value in {**turn.usage_totals, 'last_prompt_tokens': turn.last_prompt_tokens}.items()
+                        }}
+                    }
+                )
+            logger.log_trace("Session messages saved successfully", level="DEBUG")
         except Exception as e:
-            logger.log_trace(f"Error saving session messages: {str(e)}", level="ERROR")
+            logger.log_trace("Error saving session messages: %s", e, level="ERROR")
             traceback.print_exc()
             raise e
 
-    def run(self, body) -> Dict[str, str]:
-        """Run the agent with the given body"""
-        self.messages = []
+    def run(self, body, context=None) -> Dict[str, str]:
+        """
+        Run the agent with the given body.
+        When a Lambda context is given the turn returns before the invocation times out.
+        """
+        deadline = None
+        if context is not None:
+            deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - self.deadline_margin
+        with tracer.turn("agent.run", session_id=body.get("session_id")) as turn:
+            result = self.__run(body, deadline)
+            turn.incr("tools_used", len(result["tools_used"]))
+            result["usage"] = {**turn_usage(turn), "session": result.pop("session_usage")}
+            return result
+
+    def __run(self, body, deadline: Optional[float] = None) -> Dict[str, str]:
+        """Serve a single turn for the given body"""
         user_query = body.get("user_query")
         session_id = body.get("session_id")
         if not session_id:
-            session_id = str(uuid.uuid4())
-            self.messages = [{"role": "system", "content": self.system_prompt}]
-            logger.log_trace(f"Created new session ID: {session_id}", level="DEBUG")
+            turn = TurnContext(session_id=str(uuid.uuid4()), deadline=deadline)
+            turn.messages = [{"role": "system", "content": self.system_prompt}]
+            logger.log_trace("Created new session ID: %s", turn.session_id, level="DEBUG")
         else:
-            self.messages = self.__get_session_messages(session_id)
-            if self.messages:
-                logger.log_trace(f"Loaded existing session: {session_id}", level="DEBUG")
-                logger.log_trace(f"Loaded session records: {self.messages}", level="DEBUG")
+            turn = TurnContext(session_id=session_id, deadline=deadline)
+            turn.messages, usage = self.__get_session_messages(session_id)
+            turn.usage_totals = {name: usage[name] for name in SESSION_TOTALS if name in usage}
+            turn.last_prompt_tokens = int(usage.get("last_prompt_tokens", 0))
+            if turn.messages:
+                # Keep the cacheable prefix identical across sessions and prompt edits
+                if turn.messages[0]["role"] == "system":
+                    turn.messages[0] = {"role": "system", "content": self.system_prompt}
+                logger.log_trace("Loaded existing session: %s", session_id, level="DEBUG")
+                logger.log_trace("Loaded session records: %s", turn.messages, level="DEBUG")
             else: # sessionId is not there then re-initialize
-                self.messages = [{"role": "system", "content": self.system_prompt}]
-                logger.log_trace(f"Session not found, creating new session with ID: {session_id}", level="DEBUG")
+                turn.messages = [{"role": "system", "content": self.system_prompt}]
+                logger.log_trace("Session not found, creating new session with ID: %s", session_id, level="DEBUG")
 
-        self.tools_used = []
-        if user_query:
-            self.messages.append({"role": "user", "content": user_query})
-            logger.log_trace(f"Processing user query: {user_query}", level="DEBUG")
-        elif "tool_call_id" in body:
-            body.pop("session_id")
-            self.messages.append(body)
+        if self.compact_prompt_tokens and turn.last_prompt_tokens > self.compact_prompt_tokens:
+            self.__compact_history(turn)
 
-        
-        response = self.__decide()
-        logger.log_trace(f"Generated response: {response}", level="DEBUG")
+        if body.get("action") is not None:
+            response = self.__run_action(turn, body["action"])
+        else:
+            # A result for a UI-handled tool call, can be sent together with the user's follow-up query
+            if "tool_call_id" in body:
+                turn.messages.append({
+                    "role": "tool",
+                    "tool_call_id": body["tool_call_id"],
+                    "content": str(body.get("content", ""))
+                })
+                logger.log_trace("Received UI tool result for: %s", body["tool_call_id"], level="DEBUG")
+            if user_query:
+                turn.messages.append({"role": "user", "content": user_query})
+                logger.log_trace("Processing user query: %s", user_query, level="DEBUG")
+                if self.speculator is not None and not self.__over_budget(turn):
+                    turn.speculation = self.speculator.start(self.tools, user_query)
+
+            if self.__over_budget(turn):
+                tracer.incr("budget_refusals")
+                logger.log_trace("Session %s is over its token budget", turn.session_id, level="WARNING")
+                response = "This conversation has reached its usage limit. Please start a new session to continue shopping."
+            else:
+                try:
+                    response = self.__decide(turn)
+                finally:
+                    if turn.speculation is not None:
+                        turn.speculation.discard()
+        logger.log_trace("Generated response: %s", response, level="DEBUG")
         
         if not isinstance(response, dict) and "tool_call_id" not in response: # for UI inputs
-            self.messages.append({"role": "assistant", "content": response})
+            turn.messages.append({"role": "assistant", "content": response})
         
+        # Running totals include this turn, which has finished using the LLM
+        if tracer.current is not None:
+            turn.usage_totals = add_to_totals(turn.usage_totals, turn_usage(tracer.current))
+
         # Save session state
-        self.__save_session_messages(session_id)
+        self.__save_session_messages(turn)
         
-        return {"response": response, "session_id": session_id, "tools_used": self.tools_used}
+        return {"response": response, "session_id": turn.session_id, "tools_used": turn.tools_used, "session_usage": turn.usage_totals}
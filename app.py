@@ -1,10 +1,13 @@
 import streamlit as st
 import uuid
+import os
 import requests
 from datetime import datetime
 import folium
 from streamlit_folium import st_folium
 from app_utils.maps import calculate_maps_data
+from app_utils.http_client import AgentClient
+from concurrent.futures import ThreadPoolExecutor
 import copy
 
 # Initialize session state
@@ -18,6 +21,10 @@ if "shipment_details" not in st.session_state:
     st.session_state.shipment_details = None
 if "map_data" not in st.session_state:
     st.session_state.map_data = None
+if "map_cache" not in st.session_state:
+    st.session_state.map_cache = {}
+if "request_timings" not in st.session_state:
+    st.session_state.request_timings = []
 if "complete_purchase_call" not in st.session_state:
     st.session_state.complete_purchase_call = False
 if "complete_purchase_details" not in st.session_state:
@@ -29,34 +36,80 @@ if "purchase_button_clicked" not in st.session_state:
 if "purchase_response" not in st.session_state:
     st.session_state.purchase_response = None
 
+@st.cache_resource
+def get_map_executor():
+    """Shared worker pool for geocoding and routing, one per server process"""
+    return ThreadPoolExecutor(max_workers=4)
+
+def prefetch_map_data(destination):
+    """Start computing the route to destination in the background, once per (session, destination)"""
+    key = (st.session_state.session_id, destination)
+    if key not in st.session_state.map_cache:
+        future = get_map_executor().submit(calculate_maps_data, destination=destination)
+        st.session_state.map_cache[key] = {"future": future, "data": None, "map": None}
+    return st.session_state.map_cache[key]
+
+def build_map(map_data):
+    """Build the folium map with source, destination and route"""
+    # Calculate map center
+    mid_lat = (map_data["source_coords"][0] + map_data["dest_coords"][0]) / 2
+    mid_lon = (map_data["source_coords"][1] + map_data["dest_coords"][1]) / 2
+
+    m = folium.Map(location=[mid_lat, mid_lon], zoom_start=6)
+
+    # Add markers
+    folium.Marker(
+        location=map_data["source_coords"],
+        popup="Source",
+        icon=folium.Icon(color="green")
+    ).add_to(m)
+
+    folium.Marker(
+        location=map_data["dest_coords"],
+        popup="Destination",
+        icon=folium.Icon(color="red")
+    ).add_to(m)
+
+    # Add route
+    if map_data["route"]:
+        folium.PolyLine(
+            map_data["route"],
+            color="blue",
+            weight=5,
+            opacity=0.7
+        ).add_to(m)
+    return m
+
 def handle_purchase():
     """Handle purchase button click"""
     st.session_state.purchase_button_clicked = True
-    details = st.session_state.complete_purchase_details["response"]["args"]
-    details['complete_purchase'] = True
-    print("Details:", details)
-    purchase_info_response = query_agent(**details)
-    print("Purchase Info Response:", purchase_info_response)
-    purchase_tool_response = {
-        "role": "tool",
-        "tool_call_id": st.session_state.complete_purchase_details["response"]["tool_call_id"],
-        "content": purchase_info_response["response"]
-    }
-    final_response = query_agent(**purchase_tool_response)
+    # The server places the order from its cart and answers the pending tool call, no LLM round needed
+    final_response = query_agent(action={
+        "type": "complete_purchase",
+        "tool_call_id": st.session_state.complete_purchase_details["response"]["tool_call_id"]
+    })
+    print("Purchase Info Response:", final_response)
     st.session_state.purchase_response = final_response["response"]
 
+@st.cache_resource
+def get_agent_client():
+    """One pooled, keep-alive client per Streamlit server process"""
+    return AgentClient(
+        url="https://uyg4mvttiva6asn2eyuzm5a3ay0pmfdf.lambda-url.ap-south-1.on.aws/",
+        gzip_requests=os.getenv("AGENT_GZIP_REQUESTS", "false").lower() == "true"
+    )
+
 def query_agent(*args, **kwargs):
     """Send user query to Lambda function and get response"""
-    url = "https://uyg4mvttiva6asn2eyuzm5a3ay0pmfdf.lambda-url.ap-south-1.on.aws/"
-    
     payload = kwargs.copy()
     payload["session_id"] = st.session_state.session_id
     print("Payload:", payload)  # Debug
 
     try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        return response.json()
+        response, timing = get_agent_client().post(payload)
+        timing["usage"] = response.get("usage")
+        st.session_state.request_timings = ([timing] + st.session_state.request_timings)[:10]
+        return response
     except requests.exceptions.RequestException as e:
         st.error(f"Error communicating with the agent: {str(e)}")
         raise e
@@ -102,6 +155,7 @@ if not st.session_state.shipment_call and not st.session_state.complete_purchase
                             print("Setting shipment call to True")  # Debug print
                             st.session_state.shipment_call = True
                             st.session_state.shipment_details = api_response
+                            prefetch_map_data(response["args"]["destination"])
                             st.rerun()  # Force refresh to show new UI
                         elif response.get("name") == "complete_purchase":  # Add new condition for buy
                             print("Setting complete purchase call to True")
@@ -135,6 +189,14 @@ if not st.session_state.shipment_call and not st.session_state.complete_purchase
         for msg in st.session_state.messages:
             st.markdown(f"**{msg['role'].title()}**: {msg['content'][:50]}...")
 
+        with st.expander("🐞 Debug"):
+            st.markdown("**Agent round trips** (latest first)")
+            for timing in st.session_state.request_timings:
+                st.markdown(f"- `{timing['round_trip_ms']} ms` total, `{timing['time_to_headers_ms']} ms` to headers, {timing['request_bytes']} B sent ({timing['response_encoding']} response)")
+                if timing.get("usage"):
+                    usage = timing["usage"]
+                    st.markdown(f"  {usage['llm_steps']} LLM steps, {usage['prompt_tokens']} prompt ({usage['cached_tokens']} cached) + {usage['completion_tokens']} completion tokens, ${usage['cost_usd']:.5f}, `{usage['latency_ms']['llm']} ms` in the LLM")
+
 
 elif st.session_state.shipment_call:
     print("Shipment call")
@@ -166,42 +228,25 @@ elif st.session_state.shipment_call:
         st.write(f"**Date:** {datetime.now().strftime("%Y-%m-%d %H:%M")}")
 
     with col2:
-        st.session_state.map_data = calculate_maps_data(**st.session_state.shipment_details["response"]["args"])
+        map_entry = prefetch_map_data(details["destination"])
+        if map_entry["data"] is None:
+            try:
+                with st.spinner("Calculating the route..."):
+                    map_entry["data"] = map_entry["future"].result()
+            except Exception as e:
+                # Forget the failed lookup so the next rerun retries it
+                st.session_state.map_cache.pop((st.session_state.session_id, details["destination"]), None)
+                st.error(f"Error calculating the route: {str(e)}")
+                st.stop()
+        st.session_state.map_data = map_entry["data"]
         if st.session_state.map_data["source_coords"] and st.session_state.map_data["dest_coords"]:
             try:
-                # Calculate map center
-                mid_lat = (st.session_state.map_data["source_coords"][0] + 
-                        st.session_state.map_data["dest_coords"][0]) / 2
-                mid_lon = (st.session_state.map_data["source_coords"][1] + 
-                        st.session_state.map_data["dest_coords"][1]) / 2
-                
-                # Create map with cached data
-                m = folium.Map(location=[mid_lat, mid_lon], zoom_start=6)
-                
-                # Add markers
-                folium.Marker(
-                    location=st.session_state.map_data["source_coords"],
-                    popup="Source",
-                    icon=folium.Icon(color="green")
-                ).add_to(m)
-                
-                folium.Marker(
-                    location=st.session_state.map_data["dest_coords"],
-                    popup="Destination",
-                    icon=folium.Icon(color="red")
-                ).add_to(m)
-                
-                # Add route
-                if st.session_state.map_data["route"]:
-                    folium.PolyLine(
-                        st.session_state.map_data["route"],
-                        color="blue",
-                        weight=5,
-                        opacity=0.7
-                    ).add_to(m)
-                
-                # Show map
-                st_folium(m, key="persistent_map", width=None, height=400)
+                # Reuse the map built on an earlier rerun
+                if map_entry["map"] is None:
+                    map_entry["map"] = build_map(st.session_state.map_data)
+
+                # Show map, without sending pans and zooms back as reruns
+                st_folium(map_entry["map"], key="persistent_map", width=None, height=400, returned_objects=[])
                 
                 # Show route details below map
                 st.write(f"**Distance:** {st.session_state.map_data["distance"]/1000:.2f} km")
@@ -219,24 +264,19 @@ elif st.session_state.shipment_call:
                         # First, add the user's action to chat
                         st.session_state.messages.append({"role": "user", "content": button_desc})
                         
-                        # Send shipment details to agent
-                        maps_tool_response = {
-                            "role": "tool",
+                        # Send shipment details to agent together with the cost calculation action
+                        api_response = query_agent(action={
+                            "type": "calculate_total",
                             "tool_call_id": st.session_state.shipment_details["response"]["tool_call_id"],
-                            "content": f"The shipment needs to delivered to {details['destination']}. The calculated distance: {st.session_state.map_data['distance']/1000:.2f} km."
-                        }
-                        _ = query_agent(**maps_tool_response)
-                        # print("After tool response insertion:", api_response)
-                        # tools_after_tool_call = api_response.get("tools_used", [])
-                        # Get cost calculation response
-                        api_response = query_agent(user_query=button_desc)
+                            "destination": details["destination"],
+                            "shipment_distance": round(st.session_state.map_data["distance"]/1000, 2)
+                        })
                         print("After cost calculation:", api_response)
                         # Add assistant response with tools to chat history
-                        # tools_after_tool_call.extend(api_response.get("tools_used", []))
                         message_data = {
                             "role": "assistant",
                             "content": api_response["response"],
-                            "tools_used": api_response.get("tools_used", []) #tools_after_tool_call
+                            "tools_used": api_response.get("tools_used", [])
                         }
                         st.session_state.messages.append(message_data)
                         
@@ -252,16 +292,13 @@ elif st.session_state.shipment_call:
                         # First, add the user's action to chat
                         st.session_state.messages.append({"role": "user", "content": button2_desc})
                         
-                        # Send shipment details to agent
-                        maps_tool_response = {
-                            "role": "tool",
+                        # Send shipment details to agent together with the buy more action
+                        api_response = query_agent(action={
+                            "type": "add_items",
                             "tool_call_id": st.session_state.shipment_details["response"]["tool_call_id"],
-                            "content": f"The shipment needs to delivered to {details['destination']}. The calculated distance: {st.session_state.map_data['distance']/1000:.2f} km. But the user wants to add more items to the cart."
-                        }
-                        query_agent(**maps_tool_response)
-                        
-                        # Get buy more response
-                        api_response = query_agent(user_query=button2_desc)
+                            "destination": details["destination"],
+                            "shipment_distance": round(st.session_state.map_data["distance"]/1000, 2)
+                        })
                         print("After buy more:", api_response)
                         # Add assistant response with tools to chat history
                         message_data = {
@@ -0,0 +1,62 @@
+import gzip
+import json
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class AgentClient:
+    """
+    Keep-alive HTTP client for the agent endpoint.
+
+    Connections are pooled, so consecutive messages reuse the TLS session
+    instead of handshaking every time. Connection failures are retried with
+    jittered backoff for every method, since the request never reached the
+    server. Read errors and 5xx responses are only retried for idempotent
+    methods, so a POST that may already have run is never sent twice.
+    """
+    def __init__(self, url: str, connect_timeout: float = 3.05, read_timeout: float = 90,
+                 retries: int = 2, pool_size: int = 16, gzip_requests: bool = False,
+                 gzip_min_bytes: int = 1024):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.gzip_requests = gzip_requests
+        self.gzip_min_bytes = gzip_min_bytes
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=0.3,
+            backoff_jitter=0.3,
+            status_forcelist=(429, 502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json", "Accept-Encoding": "gzip"})
+
+    def post(self, payload: dict):
+        """POST payload as JSON, returning the decoded response and the round-trip timing"""
+        body = json.dumps(payload).encode("utf-8")
+        headers = {}
+        if self.gzip_requests and len(body) >= self.gzip_min_bytes:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+
+        started = time.perf_counter()
+        response = self.session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        timing = {
+            "round_trip_ms": round((time.perf_counter() - started) * 1000, 1),
+            "time_to_headers_ms": round(response.elapsed.total_seconds() * 1000, 1),
+            "request_bytes": len(body),
+            "response_encoding": response.headers.get("Content-Encoding", "identity"),
+        }
+        return data, timing
@@ -13,6 +13,7 @@ def get_location(address):
     return None
 
 # Function to get the route details (polyline, distance, duration) using OSRM API
+@lru_cache(maxsize=100)
 def get_route(source_coords, dest_coords):
     # OSRM expects coordinates as lon,lat
     url = (
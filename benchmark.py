@@ -0,0 +1,78 @@
+"""
+Throughput benchmark of the HTTP server against invoking the handler
+directly, one request at a time like a single Lambda container does.
+Both run against the local stand-in backends with simulated latency.
+
+    python benchmark.py --requests 400 --clients 32 --workers 16
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from lambda_function import handle_event
+from server import AgentServer, LocalContext
+from utils.local_backends import build_local_agent
+
+
+def summarize(name, latencies, elapsed):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+    print(f"{name:<28} {len(latencies) / elapsed:>9.1f} req/s   p50 {p50:>7.1f} ms   p95 {p95:>7.1f} ms")
+
+
+def body_for(n):
+    return {"session_id": f"bench-{n % 50}", "user_query": f"find running shoes {n}"}
+
+
+def bench_direct(args):
+    agent = build_local_agent(llm_latency=args.llm_latency, db_latency=args.db_latency)
+    latencies = []
+    started = time.perf_counter()
+    for n in range(args.requests):
+        t = time.perf_counter()
+        response = handle_event({"body": json.dumps(body_for(n))}, LocalContext(time.time() + 60), agent)
+        assert response["statusCode"] == 200
+        latencies.append((time.perf_counter() - t) * 1000)
+    summarize("direct handler (serial)", latencies, time.perf_counter() - started)
+
+
+def bench_server(args):
+    agent = build_local_agent(llm_latency=args.llm_latency, db_latency=args.db_latency)
+    server = AgentServer(("127.0.0.1", 0), workers=args.workers, max_queue=args.clients, agent=agent)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    local = threading.local()
+
+    def call(n):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        t = time.perf_counter()
+        response = local.session.post(url, json=body_for(n), timeout=60)
+        response.raise_for_status()
+        return (time.perf_counter() - t) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        latencies = list(pool.map(call, range(args.requests)))
+    summarize(f"server ({args.workers} threads, {args.clients} clients)", latencies, time.perf_counter() - started)
+    print("health:", json.dumps(server.health()))
+    server.drain(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the HTTP server against direct handler calls")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.02, help="Simulated seconds per LLM call")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="Simulated seconds per DynamoDB call")
+    args = parser.parse_args()
+    bench_direct(args)
+    bench_server(args)
+
+
+if __name__ == "__main__":
+    main()
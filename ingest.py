@@ -0,0 +1,59 @@
+import argparse
+import os
+import time
+from dotenv import load_dotenv
+from utils.ingestion import iter_catalog_batches
+from utils.logger import CustomLogger
+
+logger = CustomLogger("ingest")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stream the product catalog CSV into the vector database")
+    parser.add_argument("csv_path", help="Path to the catalog CSV, e.g. walmart-products.csv")
+    parser.add_argument("--chunksize", type=int, default=10000, help="CSV rows parsed at a time")
+    parser.add_argument("--batch-size", type=int, default=96, help="Products embedded per request")
+    parser.add_argument("--snapshot-dir", help="Sync incrementally against the snapshot in this directory")
+    parser.add_argument("--limit", type=int, help="Only ingest the first N products")
+    parser.add_argument("--dry-run", action="store_true", help="Parse and clean the CSV without indexing")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    load_dotenv()
+
+    vector_db = None
+    sync = None
+    if not args.dry_run:
+        from utils.vector_db import VectorDB, VectorDBConfig
+        vector_db = VectorDB(VectorDBConfig(api_key=os.getenv("PINECONE_API_KEY"), batch_size=args.batch_size))
+        if args.snapshot_dir:
+            from utils.catalog_snapshot import CatalogSync
+            sync = CatalogSync(vector_db, args.snapshot_dir)
+
+    started = time.monotonic()
+    last_report = started
+    products = 0
+    for batch in iter_catalog_batches(args.csv_path, chunksize=args.chunksize, batch_size=args.batch_size, limit=args.limit):
+        if sync is not None:
+            sync.sync_batch(batch)
+        elif vector_db is not None:
+            vector_db.upsert_data(batch, write_centroids=False)
+        products += len(batch)
+
+        now = time.monotonic()
+        if now - last_report >= 10:
+            last_report = now
+            logger.log_trace("Ingested %s products, %.1f products/s", products, products / (now - started), level="INFO")
+
+    elapsed = time.monotonic() - started
+    logger.log_trace("Finished: %s products in %.1fs (%.1f products/s)", products, elapsed, products / max(elapsed, 1e-9), level="INFO")
+    if sync is not None:
+        logger.log_trace("Sync summary: %s", sync.finalize(), level="INFO")
+    elif vector_db is not None and vector_db.centroids is not None:
+        vector_db.write_centroids()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,80 @@
+import base64
+import gzip
 import json
+import os
 from agent import Agent
-from utils.complete_purchase import complete_purchase
-agent = Agent()
+from schemas import action_adapter
+
+agent = None
+
+
+def get_agent():
+    """The process wide agent, created on first use"""
+    global agent
+    if agent is None:
+        agent = Agent()
+    return agent
+
+
+# Build the agent during the Lambda init phase rather than on the first request
+if os.getenv("AWS_LAMBDA_FUNCTION_NAME"):
+    get_agent()
+
+# Responses at least this large are gzipped for clients that accept it, 0 disables
+RESPONSE_GZIP_MIN_BYTES = int(os.getenv("RESPONSE_GZIP_MIN_BYTES", 0))
+
+
+def parse_body(event):
+    """Parse the JSON request body, which function URLs may deliver base64 encoded and gzipped"""
+    if 'body' not in event:
+        return event
+    body = event['body'] or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    if headers.get('content-encoding') == 'gzip':
+        body = gzip.decompress(body if isinstance(body, bytes) else body.encode('latin-1'))
+    return json.loads(body)
+
+
+def build_response(event, status_code, payload):
+    """Serialize the response, gzipping large bodies when the client accepts it"""
+    body = json.dumps(payload)
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    if RESPONSE_GZIP_MIN_BYTES and len(body) >= RESPONSE_GZIP_MIN_BYTES and 'gzip' in headers.get('accept-encoding', ''):
+        return {
+            'statusCode': status_code,
+            'headers': {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'},
+            'body': base64.b64encode(gzip.compress(body.encode('utf-8'))).decode('ascii'),
+            'isBase64Encoded': True
+        }
+    return {
+        'statusCode': status_code,
+        'body': body
+    }
+
 
 def lambda_handler(event, context):
-    # TODO implement
+    return handle_event(event, context, get_agent())
+
+
+def handle_event(event, context, agent):
+    """Serve one request/response of the agent API with the given agent"""
     # Parse the request body correctly
     try:
-        body = json.loads(event['body']) if 'body' in event else event
-    except json.JSONDecodeError:
-        return {
-            'statusCode': 400,
-            'body': json.dumps({'error': 'Invalid JSON format'})
-        }
+        body = parse_body(event)
+    except (ValueError, OSError):
+        return build_response(event, 400, {'error': 'Invalid JSON format'})
+    # Older clients flag the purchase instead of sending the action
+    if body.get('complete_purchase') == True and body.get('action') is None:
+        body['action'] = {'type': 'complete_purchase'}
+    if body.get('action') is not None:
+        try:
+            body['action'] = action_adapter.validate_python(body['action'])
+        except ValueError as e:
+            return build_response(event, 400, {'error': f'Invalid action: {e}'})
     # Extract values from parsed body
     user_query = body.get('user_query')
 
-    if "complete_purchase" in body and body["complete_purchase"] == True:
-        session_id = body.pop("session_id")
-        body.pop("complete_purchase")
-        purchase_response = complete_purchase(**body)
-        return {
-            'statusCode': 200,
-            'body': json.dumps({'user_query': user_query, 'response': purchase_response, 'tools_used': [], 'session_id': session_id})
-        }
-    
-    agent_response = agent.run(body)
-    return {
-        'statusCode': 200,
-        'body': json.dumps({'user_query': user_query, 'response': agent_response.get("response"), 'tools_used': agent_response.get("tools_used"), 'session_id': agent_response.get("session_id")})
-    }
+    agent_response = agent.run(body, context)
+    return build_response(event, 200, {'user_query': user_query, 'response': agent_response.get("response"), 'tools_used': agent_response.get("tools_used"), 'session_id': agent_response.get("session_id"), 'usage': agent_response.get("usage")})
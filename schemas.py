@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, List
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter
+from typing import Optional, List, Literal, Union, Annotated
 
 class Get_Product_Recommendations(BaseModel):
     query_text: str = Field(..., title="query_text", description="The query text for which the product recommendations are requested")
@@ -19,17 +19,38 @@ class CartItem(BaseModel):
     quantity: int = Field(..., description="Number of items purchased")
     product_price: float = Field(..., description="Price per unit of the product")
     discount: Optional[float] = Field(..., description="Discount on the product")
+    product_name: Optional[str] = Field(None, description="Name of the product")
 
 class Calculate_Total_Price(BaseModel):
-    cart_items: List[CartItem] = Field(..., description="List of items in the cart")
-    shipment_distance: float = Field(..., description="Distance for shipment")
+    shipment_distance: Optional[float] = Field(None, description="Distance for shipment in km, null to use the distance stored by shipment_details")
     model_config = ConfigDict(extra="forbid")
     
 class Complete_Purchase(BaseModel):
-    total_price: float = Field(..., description="Total cost of the order")
-    cart_items: List[CartItem] = Field(..., description="List of items in the cart")
+    model_config = ConfigDict(extra="forbid")
 
 class Get_Order_Details(BaseModel):
     order_id: int = Field(...,  title="order_id", description="Unique identifier for the order")
     model_config = ConfigDict(extra="forbid")
 
+
+### UI actions, served without the LLM deciding anything
+
+class Shipment_Action(BaseModel):
+    tool_call_id: Optional[str] = Field(None, description="Pending shipment_details call answered by this action")
+    destination: Optional[str] = Field(None, description="Destination the UI resolved")
+    shipment_distance: Optional[float] = Field(None, description="Distance for shipment in km the UI resolved")
+    model_config = ConfigDict(extra="forbid")
+
+class Calculate_Total_Action(Shipment_Action):
+    type: Literal["calculate_total"]
+
+class Add_Items_Action(Shipment_Action):
+    type: Literal["add_items"]
+
+class Complete_Purchase_Action(BaseModel):
+    type: Literal["complete_purchase"]
+    tool_call_id: Optional[str] = Field(None, description="Pending complete_purchase call answered by this action")
+    model_config = ConfigDict(extra="forbid")
+
+Action = Annotated[Union[Calculate_Total_Action, Add_Items_Action, Complete_Purchase_Action], Field(discriminator="type")]
+action_adapter = TypeAdapter(Action)
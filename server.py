@@ -0,0 +1,258 @@
+"""
+Long-running HTTP server for the agent, serving the same request/response
+contract as lambda_handler.
+
+    python server.py --workers 16 --max-queue 64           # threads sharing one Agent
+    python server.py --worker-model processes --workers 4  # one Agent per process
+    python server.py --local                               # in-process stand-in backends
+
+POST any path with the JSON body lambda_handler accepts. GET /health returns
+the server state and request metrics.
+"""
+import argparse
+import base64
+import json
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any
+from lambda_function import handle_event
+from utils.logger import CustomLogger
+
+logger = CustomLogger("server")
+
+
+class LocalContext:
+    """Stands in for the Lambda context, so the agent keeps its per-turn deadline"""
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(int((self.deadline - time.time()) * 1000), 0)
+
+
+# Agent of the current worker process, used by the processes worker model
+_process_agent = None
+
+
+def _init_process_worker(local: bool) -> None:
+    global _process_agent
+    _process_agent = build_agent(local)
+
+
+def _handle_in_process(event: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+    return handle_event(event, LocalContext(deadline), _process_agent)
+
+
+def build_agent(local: bool):
+    if local:
+        from utils.local_backends import build_local_agent
+        return build_local_agent()
+    from agent import Agent
+    return Agent()
+
+
+class ServerStats:
+    """Request counters and recent latencies, guarded by one lock"""
+    def __init__(self, window: int = 1000):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.latencies = []
+        self.window = window
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            in_flight, completed, rejected, errors = self.in_flight, self.completed, self.rejected, self.errors
+
+        def percentile(p):
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)], 2) if latencies else None
+
+        return {
+            "in_flight": in_flight,
+            "completed": completed,
+            "rejected": rejected,
+            "errors": errors,
+            "latency_ms_p50": percentile(0.5),
+            "latency_ms_p95": percentile(0.95),
+        }
+
+
+class AgentServer(ThreadingHTTPServer):
+    """
+    HTTP server with admission control in front of a worker pool.
+
+    At most workers requests run at once and at most max_queue more wait
+    for a worker; anything beyond that is rejected right away with a 503,
+    so overload shows up as fast failures instead of growing latency.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, worker_model: str = "threads", workers: int = 8, max_queue: int = 32,
+                 request_timeout: float = 60, local: bool = False, agent=None):
+        super().__init__(address, RequestHandler)
+        self.worker_model = worker_model
+        self.workers = workers
+        self.max_queue = max_queue
+        self.request_timeout = request_timeout
+        self.stats = ServerStats()
+        self.draining = False
+
+        if worker_model == "processes" and local:
+            # Every process would get its own in-memory tables, losing history and carts between turns
+            raise ValueError("The local stand-ins keep state in memory, use the threads worker model with them")
+        if worker_model == "processes":
+            self.agent = None
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_process_worker, initargs=(local,))
+        elif worker_model == "threads":
+            self.agent = agent if agent is not None else build_agent(local)
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent")
+        else:
+            raise ValueError(f"Unknown worker model: {worker_model}")
+
+    def admit(self) -> bool:
+        """Reserve a worker or queue slot for a request"""
+        with self.stats.lock:
+            if self.draining or self.stats.in_flight >= self.workers + self.max_queue:
+                self.stats.rejected += 1
+                return False
+            self.stats.in_flight += 1
+            return True
+
+    def release(self, latency_ms: float, error: bool) -> None:
+        with self.stats.lock:
+            self.stats.in_flight -= 1
+            self.stats.completed += 1
+            self.stats.errors += int(error)
+            self.stats.latencies.append(latency_ms)
+            if len(self.stats.latencies) > self.stats.window:
+                del self.stats.latencies[:len(self.stats.latencies) - self.stats.window]
+
+    def dispatch(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the request on the worker pool and wait for its response"""
+        deadline = time.time() + self.request_timeout
+        if self.worker_model == "processes":
+            future = self.executor.submit(_handle_in_process, event, deadline)
+        else:
+            future = self.executor.submit(handle_event, event, LocalContext(deadline), self.agent)
+        return future.result()
+
+    def health(self) -> Dict[str, Any]:
+        stats = self.stats.snapshot()
+        return {
+            "status": "draining" if self.draining else "ok",
+            "worker_model": self.worker_model,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queued": max(stats["in_flight"] - self.workers, 0),
+            **stats,
+        }
+
+    def drain(self, timeout: float = 30) -> None:
+        """Stop admitting requests, wait for the in-flight ones, then stop serving"""
+        self.draining = True
+        logger.log_trace("Draining, waiting for %s in-flight requests", self.stats.in_flight, level="INFO")
+        waited = 0.0
+        while self.stats.in_flight and waited < timeout:
+            time.sleep(0.1)
+            waited += 0.1
+        self.shutdown()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        logger.log_trace("Drained with %s requests left", self.stats.in_flight, level="INFO")
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/health", "/metrics"):
+            status = 503 if self.server.draining else 200
+            self.__send(status, {"Content-Type": "application/json"}, json.dumps(self.server.health()).encode("utf-8"))
+        else:
+            self.__send(404, {"Content-Type": "application/json"}, b'{"error": "Not found"}')
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.server.admit():
+            self.__send(503, {"Content-Type": "application/json", "Retry-After": "1"}, b'{"error": "Server busy"}')
+            return
+
+        started = time.perf_counter()
+        error = False
+        try:
+            # Same event shape a Lambda function URL delivers
+            event = {
+                "body": base64.b64encode(raw).decode("ascii"),
+                "isBase64Encoded": True,
+                "headers": {k.lower(): v for k, v in self.headers.items()},
+            }
+            response = self.server.dispatch(event)
+        except Exception as e:
+            error = True
+            logger.log_trace("Error serving request: %s", e, level="ERROR")
+            response = {"statusCode": 500, "body": json.dumps({"error": "Internal server error"})}
+        finally:
+            self.server.release((time.perf_counter() - started) * 1000, error)
+
+        body = response.get("body", "")
+        body = base64.b64decode(body) if response.get("isBase64Encoded") else body.encode("utf-8")
+        headers = {"Content-Type": "application/json", **response.get("headers", {})}
+        self.__send(response.get("statusCode", 200), headers, body)
+
+    def __send(self, status: int, headers: Dict[str, str], body: bytes) -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.log_trace("%s - " + format, self.address_string(), *args, level="DEBUG")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the shopping assistant agent over HTTP")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--worker-model", choices=["threads", "processes"], default="threads")
+    parser.add_argument("--workers", type=int, default=8, help="Requests served concurrently")
+    parser.add_argument("--max-queue", type=int, default=32, help="Requests allowed to wait for a worker")
+    parser.add_argument("--request-timeout", type=float, default=60, help="Per-turn time budget in seconds")
+    parser.add_argument("--drain-timeout", type=float, default=30, help="Seconds to wait for in-flight requests on shutdown")
+    parser.add_argument("--local", action="store_true", help="Use in-process stand-ins instead of OpenAI, DynamoDB and Pinecone")
+    args = parser.parse_args()
+    if args.local and args.worker_model == "processes":
+        parser.error("--local keeps sessions and carts in memory per process, use it with --worker-model threads")
+    return args
+
+
+def main():
+    args = parse_args()
+    server = AgentServer(
+        (args.host, args.port),
+        worker_model=args.worker_model,
+        workers=args.workers,
+        max_queue=args.max_queue,
+        request_timeout=args.request_timeout,
+        local=args.local,
+    )
+
+    def on_signal(signum, frame):
+        # shutdown() blocks until serve_forever returns, so drain off the main thread
+        threading.Thread(target=server.drain, args=(args.drain_timeout,), daemon=True).start()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    logger.log_trace("Serving on %s:%s with %s %s", args.host, args.port, args.workers, args.worker_model, level="INFO")
+    server.serve_forever()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
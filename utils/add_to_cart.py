@@ -1,11 +1,14 @@
-import random
+from utils.cart import CartStore
 
-def add_to_cart(product_id: int, quantity: int) -> str:
+def add_to_cart(product_id: int, quantity: int, session_id: str, cart: CartStore) -> str:
     """
-    Used to add a product to the cart given the product_id and quantity, so that the items can be checked out.
+    Used to add a product to the cart given the product_id and quantity, so that the items can be checked out. Adding a product that is already in the cart sets its quantity, a quantity of 0 removes it.
     """
+    try:
+        item = cart.set_item(session_id, product_id, quantity)
+    except ValueError as e:
+        return f"Could not add product_id: {product_id} to the cart: {str(e)}"
 
-    return f"Order with product_id: {product_id} of quantity: {quantity} has been added to the cart ✅"
-
-if __name__ == "__main__":
-    print(add_to_cart(886368088, 2))
\ No newline at end of file
+    if item is None:
+        return f"Product with product_id: {product_id} has been removed from the cart ✅"
+    return f"{item.product_name or 'Product'} (product_id: {product_id}) of quantity: {quantity} at ${item.product_price:.2f} each has been added to the cart ✅"
@@ -0,0 +1,21 @@
+import threading
+import boto3
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def get_client(service_name: str):
+    """
+    Shared boto3 client for a service. Creating clients from the default
+    session is not thread-safe, but the clients themselves are, so each is
+    created once under a lock and reused.
+    """
+    client = _clients.get(service_name)
+    if client is None:
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = boto3.client(service_name)
+                _clients[service_name] = client
+    return client
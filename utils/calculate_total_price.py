@@ -1,4 +1,7 @@
-from typing import List
+from typing import List, Optional
+
+# Delivery charge per km of shipment distance
+SHIPPING_RATE_PER_KM = 0.01
 
 def checkout(product_id: str, quantity: str, product_price: float, discount: float):
     """Returns the total price associated with each product_id after multiplying the quantity with the product_price and considering the discount as well.
@@ -18,17 +21,16 @@ def checkout(product_id: str, quantity: str, product_price: float, discount: flo
 
     return round(discounted_price, 2)
 
-def calculate_total_price(cart_items:List, shipment_distance: float):
-    """Calculates the total price of the items in the cart before final payment by considering the product_price along with the quanity and discount and the total shipment cost.
+def calculate_total_price(session_id: str, cart, shipment_distance: Optional[float] = None) -> str:
+    """Calculates the total price of the items in the user's cart before final payment by considering the product_price along with the quanity and discount and the total shipment cost for the given shipment distance, or the one already found by shipment_details.
     """
-    total_price = 0
-    product_ids_str = ""
-    for item in cart_items:
-        product_id = item.get('product_id')
-        quantity = item.get('quantity')
-        product_price = item.get('product_price')
-        discount = item.get('discount')
-        total_price += checkout(product_id, quantity, product_price, discount)
-        product_ids_str+=str(item['product_id'])+" "
-    total_price += shipment_distance * 0.01
-    return f"Total price to be paid for the cart items consisting of Product IDs: {product_ids_str} after considering the delivery charges and the product prices with their discounts: {total_price}"
\ No newline at end of file
+    if shipment_distance is not None:
+        cart.set_shipment(session_id, shipment_distance)
+    quote = cart.quote(session_id)
+    if not quote["cart_items"]:
+        return "The cart is empty, add products to the cart before calculating the total price."
+    if quote["shipment_distance"] is None:
+        return "The shipment distance is not known yet, ask the user for the destination and get its shipment details first."
+
+    product_ids_str = " ".join(str(item["product_id"]) for item in quote["cart_items"])
+    return f"Total price to be paid for the cart items consisting of Product IDs: {product_ids_str} after considering the delivery charges ({quote['shipment_cost']}) and the product prices with their discounts: {quote['total_price']}"
@@ -0,0 +1,206 @@
+from dataclasses import dataclass, field, replace
+from typing import Dict, Any, Optional
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from schemas import CartItem
+from utils.calculate_total_price import checkout, SHIPPING_RATE_PER_KM
+from utils.logger import CustomLogger
+from utils.metrics import tracer
+
+logger = CustomLogger('cart')
+
+ITEM_PREFIX = "item#"
+
+
+def parse_price(value: Any) -> float:
+    """Turn catalog prices like "$12.50", "1,299.00" or 3.5 into floats"""
+    if value is None:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return 0.0 if math.isnan(value) else float(value)
+    text = str(value).replace("$", "").replace(",", "").strip()
+    try:
+        price = float(text)
+    except ValueError:
+        return 0.0
+    return 0.0 if math.isnan(price) else price
+
+
+@dataclass
+class Cart:
+    items: Dict[int, CartItem] = field(default_factory=dict)
+    destination: Optional[str] = None
+    shipment_distance: Optional[float] = None
+
+
+class CartStore:
+    """
+    Per-session carts in the DynamoDB `carts` table, with a short-lived
+    in-memory cache in front.
+
+    Each cart item is its own attribute (item#<product_id>), so adding or
+    changing a product is a single atomic update_item without reading the
+    cart first. Prices come from the catalog, never from the LLM. Any amount
+    shown as payable and the purchase itself read the cart fresh, as another
+    process may have changed it; the cache only serves re-reads of a cart
+    this process has just read or written.
+    """
+    def __init__(self, dynamodb, catalog, table_name: str = "carts", cache_ttl: Optional[float] = None,
+                 max_cached: int = 10000):
+        self.dynamodb = dynamodb
+        self.catalog = catalog
+        self.table_name = table_name
+        self.cache_ttl = cache_ttl if cache_ttl is not None else float(os.getenv("CART_CACHE_TTL", 30))
+        self.max_cached = max_cached
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, fresh: bool = False) -> Cart:
+        """Cart of the session, from the cache unless fresh is set or the entry expired"""
+        if not fresh:
+            with self._lock:
+                cached = self._cache.get(session_id)
+            if cached and time.monotonic() - cached[1] < self.cache_ttl:
+                return replace(cached[0], items=dict(cached[0].items))
+
+        with tracer.span("cart_load"):
+            response = self.dynamodb.get_item(
+                TableName=self.table_name,
+                Key={'session_id': {'S': session_id}},
+                ConsistentRead=True
+            )
+        cart = self.__parse(response.get('Item', {}))
+        self.__cache(session_id, cart)
+        return replace(cart, items=dict(cart.items))
+
+    def set_item(self, session_id: str, product_id: int, quantity: int) -> Optional[CartItem]:
+        """Set the quantity of a product, hydrating its price from the catalog. Quantity 0 removes it."""
+        attribute = {'#item': f"{ITEM_PREFIX}{product_id}"}
+        if quantity <= 0:
+            with tracer.span("cart_save"):
+                self.dynamodb.update_item(
+                    TableName=self.table_name,
+                    Key={'session_id': {'S': session_id}},
+                    UpdateExpression="REMOVE #item",
+                    ExpressionAttributeNames=attribute
+                )
+            self.__update_cached(session_id, lambda cart: cart.items.pop(product_id, None))
+            return None
+
+        product = self.catalog.get_product(product_id)
+        if product is None:
+            raise ValueError(f"Product ID {product_id} was not found in the catalog")
+        item = CartItem(
+            product_id=product_id,
+            quantity=quantity,
+            product_price=parse_price(product.get("final_price")),
+            discount=parse_price(product.get("discount")),
+            product_name=product.get("product_name")
+        )
+        with tracer.span("cart_save"):
+            self.dynamodb.update_item(
+                TableName=self.table_name,
+                Key={'session_id': {'S': session_id}},
+                UpdateExpression="SET #item = :item",
+                ExpressionAttributeNames=attribute,
+                ExpressionAttributeValues={':item': {'M': self.__serialize_item(item)}}
+            )
+        self.__update_cached(session_id, lambda cart: cart.items.__setitem__(product_id, item))
+        return item
+
+    def set_shipment(self, session_id: str, shipment_distance: float, destination: Optional[str] = None) -> None:
+        """Remember the shipment distance (km) used for the session's totals"""
+        names = {'#distance': 'shipment_distance'}
+        values = {':distance': {'N': str(shipment_distance)}}
+        expression = "SET #distance = :distance"
+        if destination:
+            names['#destination'] = 'destination'
+            values[':destination'] = {'S': destination}
+            expression += ", #destination = :destination"
+        with tracer.span("cart_save"):
+            self.dynamodb.update_item(
+                TableName=self.table_name,
+                Key={'session_id': {'S': session_id}},
+                UpdateExpression=expression,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
+            )
+
+        def apply(cart):
+            cart.shipment_distance = shipment_distance
+            cart.destination = destination or cart.destination
+        self.__update_cached(session_id, apply)
+
+    def clear(self, session_id: str) -> None:
+        """Empty the session's cart, after a purchase"""
+        with tracer.span("cart_save"):
+            self.dynamodb.delete_item(
+                TableName=self.table_name,
+                Key={'session_id': {'S': session_id}}
+            )
+        self.__cache(session_id, Cart())
+
+    def quote(self, session_id: str, fresh: bool = True) -> Dict[str, Any]:
+        """Line totals, shipment cost and grand total of the session's cart"""
+        cart = self.get(session_id, fresh=fresh)
+        cart_items = []
+        items_total = 0.0
+        for item in cart.items.values():
+            line_total = checkout(item.product_id, item.quantity, item.product_price, item.discount or 0.0)
+            items_total += line_total
+            cart_items.append({**item.model_dump(), "line_total": line_total})
+        shipment_cost = round((cart.shipment_distance or 0.0) * SHIPPING_RATE_PER_KM, 2)
+        return {
+            "cart_items": cart_items,
+            "destination": cart.destination,
+            "shipment_distance": cart.shipment_distance,
+            "shipment_cost": shipment_cost,
+            "total_price": round(items_total + shipment_cost, 2),
+        }
+
+    def __cache(self, session_id: str, cart: Cart) -> None:
+        with self._lock:
+            self._cache[session_id] = (cart, time.monotonic())
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def __update_cached(self, session_id: str, apply) -> None:
+        """Apply a write to the cached cart too, if one is cached"""
+        with self._lock:
+            cached = self._cache.get(session_id)
+            if cached:
+                apply(cached[0])
+
+    def __serialize_item(self, item: CartItem) -> Dict[str, Any]:
+        serialized = {
+            'product_id': {'N': str(item.product_id)},
+            'quantity': {'N': str(item.quantity)},
+            'product_price': {'N': str(item.product_price)},
+            'discount': {'N': str(item.discount or 0.0)},
+        }
+        if item.product_name:
+            serialized['product_name'] = {'S': item.product_name}
+        return serialized
+
+    def __parse(self, item: Dict[str, Any]) -> Cart:
+        cart = Cart()
+        for name, value in item.items():
+            if name.startswith(ITEM_PREFIX):
+                data = value['M']
+                cart_item = CartItem(
+                    product_id=int(data['product_id']['N']),
+                    quantity=int(data['quantity']['N']),
+                    product_price=float(data['product_price']['N']),
+                    discount=float(data['discount']['N']),
+                    product_name=data.get('product_name', {}).get('S')
+                )
+                cart.items[cart_item.product_id] = cart_item
+        if 'shipment_distance' in item:
+            cart.shipment_distance = float(item['shipment_distance']['N'])
+        if 'destination' in item:
+            cart.destination = item['destination']['S']
+        return cart
@@ -0,0 +1,244 @@
+from typing import List, Dict, Any, Optional, Tuple
+import hashlib
+import json
+import os
+import numpy as np
+from utils.logger import CustomLogger
+from utils.category_router import CentroidAccumulator
+
+logger = CustomLogger('catalog_snapshot')
+
+MANIFEST_FILE = "manifest.json"
+# Embeddings of each snapshot generation, named in its manifest
+EMBEDDINGS_FILE = "embeddings-{generation}.npy"
+# Single embeddings file of snapshots written before generations
+LEGACY_EMBEDDINGS_FILE = "embeddings.npy"
+PENDING_FILE = "embeddings.pending"
+
+
+def content_hash(value: str) -> str:
+    """Short, stable hash of a string"""
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def record_hashes(metadata: Dict[str, Any]) -> Tuple[str, str]:
+    """Hash of the embedded text and hash of the full metadata of a product"""
+    text_hash = content_hash(str(metadata["description"]))
+    meta_hash = content_hash(json.dumps(metadata, sort_keys=True, default=str))
+    return text_hash, meta_hash
+
+
+class CatalogSnapshot:
+    """
+    IDs, content hashes and embeddings of the catalog as of the last sync.
+
+    IDs must be stable product keys (the catalog's product_id), never row
+    positions, as products are matched to their snapshot entry by ID alone.
+
+    Row i of the manifest lists matches row i of the embeddings file the
+    manifest names, which is opened memory-mapped so only the rows that are
+    reused get paged in. Every sync writes a new generation's embeddings
+    file before swapping in the manifest that points to it, so a crash at
+    any point leaves a manifest with its own embeddings.
+    """
+    def __init__(self, path: str, dimension: int):
+        self.path = path
+        self.dimension = dimension
+        self.ids: List[str] = []
+        self.text_hashes: List[str] = []
+        self.meta_hashes: List[str] = []
+        self.namespaces: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.generation = 0
+        self.embeddings_file: Optional[str] = None
+        self.embeddings: Optional[np.ndarray] = None
+
+    @classmethod
+    def load(cls, path: str, dimension: int) -> "CatalogSnapshot":
+        """Load the snapshot in path, or an empty one if there is none"""
+        snapshot = cls(path, dimension)
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return snapshot
+
+        with open(manifest_path, "r") as file:
+            manifest = json.load(file)
+        if manifest["dimension"] != dimension:
+            raise ValueError(f"Snapshot dimension {manifest['dimension']} does not match index dimension {dimension}")
+        snapshot.ids = manifest["ids"]
+        snapshot.text_hashes = manifest["text_hashes"]
+        snapshot.meta_hashes = manifest["meta_hashes"]
+        # Snapshots from before category partitions had everything in the default namespace
+        snapshot.namespaces = manifest.get("namespaces") or [""] * len(snapshot.ids)
+        snapshot.rows = {id: row for row, id in enumerate(snapshot.ids)}
+        snapshot.generation = manifest.get("generation", 0)
+        snapshot.embeddings_file = manifest.get("embeddings_file", LEGACY_EMBEDDINGS_FILE)
+        if snapshot.ids:
+            embeddings_path = os.path.join(path, snapshot.embeddings_file)
+            embeddings = np.load(embeddings_path, mmap_mode="r") if os.path.exists(embeddings_path) else None
+            if embeddings is None or embeddings.shape != (len(snapshot.ids), dimension):
+                # A missing or truncated file, start over with a full sync
+                logger.log_trace("Snapshot in %s is inconsistent, ignoring it", path, level='WARNING')
+                return cls(path, dimension)
+            snapshot.embeddings = embeddings
+        return snapshot
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class CatalogSync:
+    """
+    Diffs batches of catalog records against the last snapshot and pushes
+    only the changes to the vector database.
+
+    New products and products whose description changed are embedded,
+    products with only metadata changes are re-upserted with their
+    snapshot embedding, and products missing from the catalog are deleted
+    by finalize(), which also writes the new snapshot. Products whose
+    namespace changed (a new root category, or partitioning switched on)
+    are moved with their snapshot embedding, and with partitioning on the
+    category centroids are rebuilt from the whole catalog.
+    """
+    def __init__(self, vector_db, snapshot_dir: str):
+        self.vector_db = vector_db
+        self.snapshot_dir = snapshot_dir
+        self.dimension = vector_db.config.dimension
+        os.makedirs(snapshot_dir, exist_ok=True)
+        self.snapshot = CatalogSnapshot.load(snapshot_dir, self.dimension)
+
+        # id -> (embedding comes from snapshot, row, text hash, metadata hash, namespace)
+        self._entries: Dict[str, Tuple[bool, int, str, str, str]] = {}
+        # namespace -> ids to delete there, for products that moved to another namespace
+        self._moved: Dict[str, List[str]] = {}
+        self.centroids = CentroidAccumulator(self.dimension) if vector_db.config.partition_by_category else None
+        self._pending_path = os.path.join(snapshot_dir, PENDING_FILE)
+        self._pending = open(self._pending_path, "wb")
+        self._pending_rows = 0
+        self.stats = {"added": 0, "reembedded": 0, "metadata_updated": 0, "moved": 0, "unchanged": 0, "deleted": 0,
+                      "duplicates": 0}
+
+    def sync_batch(self, data: List[Dict[str, Any]]) -> None:
+        """Sync one batch of catalog records"""
+        to_embed = []
+        records = []
+        embedding = set()
+        for doc in data:
+            metadata = doc.copy()
+            id = str(metadata.pop("id"))
+            if id in self._entries or id in embedding:
+                # Keep the first product with the ID, a second one would replace it in the snapshot
+                self.stats["duplicates"] += 1
+                logger.log_trace("Skipping product with duplicate ID %s", id, level='WARNING')
+                continue
+            text_hash, meta_hash = record_hashes(metadata)
+            namespace = self.vector_db.namespace_of(metadata)
+            row = self.snapshot.rows.get(id)
+            if row is not None and self.snapshot.namespaces[row] != namespace:
+                self._moved.setdefault(self.snapshot.namespaces[row], []).append(id)
+
+            if row is not None and self.snapshot.text_hashes[row] == text_hash:
+                self._entries[id] = (True, row, text_hash, meta_hash, namespace)
+                if self.centroids is not None:
+                    self.centroids.add(metadata, self.snapshot.embeddings[row])
+                if self.snapshot.namespaces[row] != namespace:
+                    self.stats["moved"] += 1
+                elif self.snapshot.meta_hashes[row] == meta_hash:
+                    self.stats["unchanged"] += 1
+                    continue
+                else:
+                    self.stats["metadata_updated"] += 1
+                records.append({
+                    "id": id,
+                    "values": self.snapshot.embeddings[row].tolist(),
+                    "metadata": metadata
+                })
+            else:
+                self.stats["added" if row is None else "reembedded"] += 1
+                to_embed.append((id, metadata, text_hash, meta_hash, namespace))
+                embedding.add(id)
+
+        if to_embed:
+            embeddings = self.vector_db.embed_passages([str(m["description"]) for _, m, _, _, _ in to_embed])
+            for (id, metadata, text_hash, meta_hash, namespace), values in zip(to_embed, embeddings):
+                self._pending.write(np.asarray(values, dtype=np.float32).tobytes())
+                self._entries[id] = (False, self._pending_rows, text_hash, meta_hash, namespace)
+                self._pending_rows += 1
+                if self.centroids is not None:
+                    self.centroids.add(metadata, values)
+                records.append({"id": id, "values": values, "metadata": metadata})
+
+        if records:
+            self.vector_db.upsert_records(records)
+
+    def finalize(self) -> Dict[str, int]:
+        """Delete removed products and write the new snapshot"""
+        self._pending.close()
+        removed = [id for id in self.snapshot.ids if id not in self._entries]
+        stale = self._moved
+        for id in removed:
+            stale.setdefault(self.snapshot.namespaces[self.snapshot.rows[id]], []).append(id)
+        for namespace, ids in stale.items():
+            self.vector_db.delete_records(ids, namespace=namespace)
+        self.stats["deleted"] = len(removed)
+        if self.centroids is not None:
+            self.vector_db.write_centroids(self.centroids, replace=True)
+
+        self.__write_snapshot()
+        os.remove(self._pending_path)
+        return self.stats
+
+    def __write_snapshot(self) -> None:
+        """Write the next generation's embeddings, then swap in the manifest pointing to them"""
+        ids = list(self._entries)
+        from_snapshot = np.fromiter((self._entries[id][0] for id in ids), dtype=bool, count=len(ids))
+        source_rows = np.fromiter((self._entries[id][1] for id in ids), dtype=np.int64, count=len(ids))
+
+        pending = None
+        if self._pending_rows:
+            pending = np.memmap(self._pending_path, dtype=np.float32, mode="r", shape=(self._pending_rows, self.dimension))
+
+        generation = self.snapshot.generation + 1
+        embeddings_file = None
+        if ids:
+            embeddings_file = EMBEDDINGS_FILE.format(generation=generation)
+            embeddings_path = os.path.join(self.snapshot_dir, embeddings_file)
+            tmp_embeddings_path = embeddings_path + ".tmp"
+            out = np.lib.format.open_memmap(tmp_embeddings_path, mode="w+", dtype=np.float32, shape=(len(ids), self.dimension))
+            chunk = 10000
+            for start in range(0, len(ids), chunk):
+                end = min(start + chunk, len(ids))
+                mask = from_snapshot[start:end]
+                rows = source_rows[start:end]
+                block = np.empty((end - start, self.dimension), dtype=np.float32)
+                if mask.any():
+                    block[mask] = self.snapshot.embeddings[rows[mask]]
+                if (~mask).any():
+                    block[~mask] = pending[rows[~mask]]
+                out[start:end] = block
+            out.flush()
+            del out
+            os.replace(tmp_embeddings_path, embeddings_path)
+        del pending
+        # Release the old mapping before its file is removed
+        self.snapshot.embeddings = None
+
+        manifest = {
+            "dimension": self.dimension,
+            "generation": generation,
+            "embeddings_file": embeddings_file,
+            "ids": ids,
+            "text_hashes": [self._entries[id][2] for id in ids],
+            "meta_hashes": [self._entries[id][3] for id in ids],
+            "namespaces": [self._entries[id][4] for id in ids],
+        }
+        manifest_path = os.path.join(self.snapshot_dir, MANIFEST_FILE)
+        with open(manifest_path + ".tmp", "w") as file:
+            json.dump(manifest, file)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+        # Older generations, and any left behind by an interrupted sync
+        for name in os.listdir(self.snapshot_dir):
+            if name.startswith("embeddings") and name.endswith((".npy", ".npy.tmp")) and name != embeddings_file:
+                os.remove(os.path.join(self.snapshot_dir, name))
+        logger.log_trace("Wrote catalog snapshot with %s products", len(ids), level='INFO')
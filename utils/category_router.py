@@ -0,0 +1,166 @@
+from collections import Counter
+from typing import List, Dict, Any, Iterable, Optional
+import math
+import re
+import threading
+import time
+import numpy as np
+from utils.logger import CustomLogger
+from utils.metrics import tracer
+
+logger = CustomLogger('category_router')
+
+# Namespace holding one centroid vector per category partition
+CENTROIDS_NAMESPACE = "__centroids__"
+# Category path words kept per partition for keyword routing
+MAX_KEYWORDS = 50
+
+
+def slugify(value: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", value.lower()).strip("-")
+
+
+def category_of(metadata: Dict[str, Any]) -> str:
+    category = metadata.get("root_category_name")
+    if category is None or (isinstance(category, float) and math.isnan(category)) or not str(category).strip():
+        return "Uncategorized"
+    return str(category).strip()
+
+
+def namespace_for(metadata: Dict[str, Any]) -> str:
+    """Partition namespace of a product, from its root category"""
+    return f"cat-{slugify(category_of(metadata)) or 'uncategorized'}"
+
+
+def words(text: str) -> List[str]:
+    return [w for w in re.findall(r"[a-z]+", text.lower()) if len(w) > 2]
+
+
+class CentroidAccumulator:
+    """Running per-partition vector sums and category keywords, turned into centroid records"""
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.sums: Dict[str, np.ndarray] = {}
+        self.counts: Counter = Counter()
+        self.categories: Dict[str, str] = {}
+        self.keywords: Dict[str, Counter] = {}
+
+    def add(self, metadata: Dict[str, Any], values: Iterable[float]) -> None:
+        namespace = namespace_for(metadata)
+        if namespace not in self.sums:
+            self.sums[namespace] = np.zeros(self.dimension, dtype=np.float64)
+            self.categories[namespace] = category_of(metadata)
+            self.keywords[namespace] = Counter()
+        self.sums[namespace] += np.asarray(values, dtype=np.float64)
+        self.counts[namespace] += 1
+        self.keywords[namespace].update(words(f"{category_of(metadata)} {metadata.get('category_name') or ''}"))
+
+    def records(self, stored: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        Centroid records of the accumulated partitions. Stored centroid matches
+        of the same partitions are merged in, weighted by their product counts.
+        """
+        stored_by_namespace = {m["metadata"]["namespace"]: m for m in stored or []}
+        records = []
+        for namespace, total in self.sums.items():
+            norm = np.linalg.norm(total)
+            if not norm:
+                continue
+            count = self.counts[namespace]
+            centroid = total / norm * count
+            keywords = [w for w, _ in self.keywords[namespace].most_common(MAX_KEYWORDS)]
+            previous = stored_by_namespace.get(namespace)
+            if previous is not None:
+                previous_count = int(previous["metadata"].get("count", 0))
+                centroid = centroid + np.asarray(previous["values"], dtype=np.float64) * previous_count
+                count += previous_count
+                keywords = list(dict.fromkeys([*previous["metadata"].get("keywords", []), *keywords]))[:MAX_KEYWORDS]
+            records.append({
+                "id": namespace,
+                "values": (centroid / (np.linalg.norm(centroid) or 1.0)).tolist(),
+                "metadata": {
+                    "namespace": namespace,
+                    "root_category_name": self.categories[namespace],
+                    "count": count,
+                    "keywords": keywords,
+                },
+            })
+        return records
+
+
+class CategoryRouter:
+    """
+    Picks the category partitions worth searching for a query.
+
+    Each partition is scored by the cosine similarity of the query embedding
+    with the partition centroid, plus keyword_weight for every query word
+    found in the partition's category names. The best max_partitions are
+    searched; when even the best partition scores below min_score, the query
+    is too vague to route and no partitions are returned, so the caller
+    searches every partition in the index. Centroids are loaded from the
+    index and reloaded after refresh_seconds.
+    """
+    def __init__(self, index, dimension: int, max_partitions: int = 2, min_score: float = 0.75,
+                 keyword_weight: float = 0.05, refresh_seconds: float = 300):
+        self.index = index
+        self.dimension = dimension
+        self.max_partitions = max_partitions
+        self.min_score = min_score
+        self.keyword_weight = keyword_weight
+        self.refresh_seconds = refresh_seconds
+        self.namespaces: List[str] = []
+        self.centroids = np.zeros((0, dimension), dtype=np.float32)
+        self.keywords: List[frozenset] = []
+        self._loaded_at = -math.inf
+        self._lock = threading.Lock()
+
+    def fetch(self) -> List[Dict[str, Any]]:
+        """Every stored centroid, with its values and metadata"""
+        vector = [0.0] * self.dimension
+        vector[0] = 1.0
+        results = self.index.query(
+            vector=vector,
+            top_k=1000,
+            namespace=CENTROIDS_NAMESPACE,
+            include_values=True,
+            include_metadata=True
+        )
+        return results["matches"]
+
+    def load(self) -> None:
+        """Fetch every centroid from the centroids namespace"""
+        matches = self.fetch()
+        namespaces = [m["metadata"]["namespace"] for m in matches]
+        centroids = np.array([m["values"] for m in matches], dtype=np.float32).reshape(len(matches), self.dimension)
+        keywords = [frozenset(m["metadata"].get("keywords", [])) | frozenset(words(m["metadata"]["root_category_name"])) for m in matches]
+        with self._lock:
+            self.namespaces, self.centroids, self.keywords = namespaces, centroids, keywords
+            self._loaded_at = time.monotonic()
+        logger.log_trace("Loaded %s category centroids", len(namespaces), level="INFO")
+
+    def route(self, query_text: str, query_vector: List[float]) -> List[str]:
+        """Namespaces to search for the query, best first, or none when it cannot be routed"""
+        if time.monotonic() - self._loaded_at > self.refresh_seconds:
+            try:
+                self.load()
+            except Exception as e:
+                logger.log_trace("Could not load category centroids: %s", e, level="WARNING")
+                with self._lock:
+                    self._loaded_at = time.monotonic()
+        with self._lock:
+            namespaces, centroids, keywords = self.namespaces, self.centroids, self.keywords
+        if not namespaces:
+            return []
+
+        with tracer.span("vector_db.route", partitions=len(namespaces)):
+            query = np.asarray(query_vector, dtype=np.float32)
+            scores = centroids @ (query / (np.linalg.norm(query) or 1.0))
+            query_words = frozenset(words(query_text))
+            scores = scores + self.keyword_weight * np.array([len(query_words & k) for k in keywords], dtype=np.float32)
+            order = np.argsort(-scores)
+
+        if scores[order[0]] < self.min_score:
+            tracer.incr("router_fallbacks")
+            logger.log_trace("No confident partition for %r (best %.3f), searching all", query_text, float(scores[order[0]]), level="DEBUG")
+            return []
+        return [namespaces[i] for i in order[:self.max_partitions]]
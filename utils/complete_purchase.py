@@ -1,5 +1,4 @@
 import random
-import boto3
 from decimal import Decimal
 
 # def complete_purchase(total_price: float, cart_items: list):
@@ -13,31 +12,34 @@ from decimal import Decimal
 
 
 
-def complete_purchase(total_price: float, cart_items: list):
-    """Generates a short order ID and tracking ID, then confirms order placement and stores in the orders table for future reference."""
+def complete_purchase(session_id: str, cart, dynamodb):
+    """Places the order for all the items in the user's cart at the calculated total cost. Generates a short order ID and tracking ID, then confirms order placement and stores in the orders table for future reference."""
+    quote = cart.quote(session_id)
+    if not quote["cart_items"]:
+        return "The cart is empty, there is nothing to purchase."
+
     # Generate order and tracking IDs
     order_id = random.randint(1000, 9999)
     tracking_id = str(random.randint(100000, 999999))
     
     # Extract product IDs as a list
-    product_ids = [str(cart_item['product_id']) for cart_item in cart_items]
-    product_ids_str = " ".join(product_ids)  # Only for display in return message
+    product_ids = [str(cart_item['product_id']) for cart_item in quote["cart_items"]]
+    product_names = ", ".join(cart_item['product_name'] or str(cart_item['product_id']) for cart_item in quote["cart_items"])
     
     # Store in DynamoDB
     try:
-        dynamodb = boto3.resource('dynamodb')
-        table = dynamodb.Table('orders')
-        
         # Insert the order into DynamoDB
-        table.put_item(
+        dynamodb.put_item(
+            TableName='orders',
             Item={
-                'order_id': order_id,
-                'tracking_id': tracking_id,
-                'product_ids': product_ids,  # Storing as a list directly
-                'total_cost': Decimal(str(total_price))  # Convert float to Decimal for DynamoDB
+                'order_id': {'N': str(order_id)},
+                'tracking_id': {'S': tracking_id},
+                'product_ids': {'L': [{'S': product_id} for product_id in product_ids]},  # Storing as a list directly
+                'total_cost': {'N': str(Decimal(str(quote["total_price"])))}
             }
         )
     except Exception as e:
         return f"Error storing order: {str(e)}"
-    
-    return f"Order has been placed successfully! Order ID: {str(order_id)}, Tracking ID: {tracking_id}. Product IDs are {product_ids_str}"
\ No newline at end of file
+
+    cart.clear(session_id)
+    return f"Order has been placed successfully! Order ID: {str(order_id)}, Tracking ID: {tracking_id}, Total cost: {quote['total_price']}. Products: {product_names}. Product IDs are {' '.join(product_ids)}"
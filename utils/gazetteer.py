@@ -0,0 +1,137 @@
+from typing import Dict, List, Any, Optional
+import csv
+import json
+import os
+import re
+import threading
+import time
+import urllib.request
+import numpy as np
+from utils.logger import CustomLogger
+from utils.metrics import tracer
+
+logger = CustomLogger('gazetteer')
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cities.csv")
+EARTH_RADIUS_KM = 6371.0088
+# Common short forms of the country names used in the CSV
+COUNTRY_ALIASES = {
+    "United States": ("us", "usa", "united states of america", "america"),
+    "United Kingdom": ("uk", "england", "great britain", "britain"),
+    "United Arab Emirates": ("uae",),
+}
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km from one point to arrays of points"""
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def normalize(name: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", name.lower())).strip()
+
+
+class Gazetteer:
+    """
+    Offline shipment distance lookup from the warehouse to known cities.
+
+    Distances to every city in the bundled CSV are computed once with a
+    vectorized haversine and scaled by road_factor to approximate driving
+    distance. When a routing_url (an OSRM compatible server) is configured
+    and reachable, the driving distance of the route replaces the estimate.
+    Unknown destinations resolve to None, and so do known city names
+    qualified by some other country or region ("London, Ontario").
+    """
+    def __init__(self, path: str = DEFAULT_PATH, origin: str = "Kolkata", road_factor: Optional[float] = None,
+                 routing_url: Optional[str] = None, routing_timeout: float = 2.0, routing_retry_after: float = 60.0):
+        self.road_factor = road_factor if road_factor is not None else float(os.getenv("ROAD_DISTANCE_FACTOR", 1.3))
+        self.routing_url = (routing_url if routing_url is not None else os.getenv("ROUTING_URL", "")).rstrip("/")
+        self.routing_timeout = routing_timeout
+        self.routing_retry_after = routing_retry_after
+
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        self.names = [f"{row['city']}, {row['country']}" for row in rows]
+        self.coords = np.array([(float(row["latitude"]), float(row["longitude"])) for row in rows])
+        self.index: Dict[str, int] = {}
+        self.qualifiers: List[frozenset] = []
+        for i, row in enumerate(rows):
+            names = [row["city"], *filter(None, row["aliases"].split("|"))]
+            for name in names:
+                self.index.setdefault(normalize(name), i)
+                self.index.setdefault(normalize(f"{name} {row['country']}"), i)
+            countries = [row["country"], *COUNTRY_ALIASES.get(row["country"], ())]
+            self.qualifiers.append(frozenset(normalize(name) for name in [*names, *countries]))
+
+        origin_row = self.index.get(normalize(origin))
+        if origin_row is None:
+            raise ValueError(f"Origin {origin} is not in the gazetteer")
+        self.origin = tuple(self.coords[origin_row])
+        self.distances_km = haversine_km(*self.origin, self.coords[:, 0], self.coords[:, 1])
+
+        self._routes: Dict[int, float] = {}
+        self._routing_down_until = 0.0
+        self._lock = threading.Lock()
+
+    def lookup(self, destination: str) -> Optional[int]:
+        """
+        Row of the destination, trying the whole name and then each comma
+        separated part. A part only matches when every other part names the
+        same city or its country, so "Hyderabad, Pakistan" is not taken for
+        Hyderabad, India.
+        """
+        row = self.index.get(normalize(destination))
+        if row is not None:
+            return row
+        parts = [part for part in map(normalize, destination.split(",")) if part]
+        for part in parts:
+            row = self.index.get(part)
+            if row is not None and all(other in self.qualifiers[row] for other in parts):
+                return row
+        return None
+
+    def resolve(self, destination: str) -> Optional[Dict[str, Any]]:
+        """Canonical name, coordinates and shipment distance (km) of the destination"""
+        row = self.lookup(destination)
+        if row is None:
+            logger.log_trace("Destination not in the gazetteer: %s", destination, level="INFO")
+            return None
+
+        distance_km, source = self.__route_km(row), "route"
+        if distance_km is None:
+            distance_km, source = float(self.distances_km[row]) * self.road_factor, "estimate"
+        return {
+            "destination": self.names[row],
+            "coords": tuple(float(c) for c in self.coords[row]),
+            "distance_km": round(distance_km, 2),
+            "source": source,
+        }
+
+    def __route_km(self, row: int) -> Optional[float]:
+        """Driving distance from the routing backend, None when it is not configured or not reachable"""
+        if not self.routing_url:
+            return None
+        with self._lock:
+            if row in self._routes:
+                return self._routes[row]
+            if time.monotonic() < self._routing_down_until:
+                return None
+
+        (src_lat, src_lon), (dst_lat, dst_lon) = self.origin, self.coords[row]
+        url = f"{self.routing_url}/route/v1/driving/{src_lon},{src_lat};{dst_lon},{dst_lat}?overview=false"
+        try:
+            with tracer.span("routing"):
+                with urllib.request.urlopen(url, timeout=self.routing_timeout) as response:
+                    data = json.load(response)
+            distance_km = data["routes"][0]["distance"] / 1000
+        except Exception as e:
+            logger.log_trace("Routing backend unavailable, using the estimate: %s", e, level="WARNING")
+            with self._lock:
+                self._routing_down_until = time.monotonic() + self.routing_retry_after
+            return None
+
+        with self._lock:
+            self._routes[row] = distance_km
+        return distance_km
@@ -1,11 +1,8 @@
-import boto3
 import traceback
-def get_order_details(order_id: int):
+def get_order_details(order_id: int, dynamodb):
     """Get all messages from DDB"""
         # Store in DynamoDB
     try:
-        dynamodb = boto3.client('dynamodb')
-        
         response = dynamodb.get_item(
                         TableName='orders',
                         Key={'order_id': {'N': str(order_id)}}
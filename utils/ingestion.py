@@ -0,0 +1,54 @@
+from typing import List, Dict, Any, Iterator, Optional
+import numpy as np
+import pandas as pd
+
+# Columns of the Walmart products dataset that end up in the index
+# https://github.com/luminati-io/eCommerce-dataset-samples/blob/main/walmart-products.csv
+CATALOG_COLUMNS = [
+    'final_price', 'currency', 'brand', 'product_id', 'product_name',
+    'description', 'category_name', 'root_category_name', 'discount', 'rating'
+]
+
+
+def clean_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Drop products without a product ID or description and normalize prices, column at a time"""
+    chunk = chunk[CATALOG_COLUMNS]
+    product_ids = pd.to_numeric(chunk['product_id'], errors='coerce')
+    description = chunk['description']
+    chunk = chunk[product_ids.notna() & description.notna() & description.astype(str).str.strip().ne('')].copy()
+    chunk['product_id'] = product_ids[chunk.index].astype(np.int64)
+
+    prices = pd.to_numeric(chunk['final_price'], errors='coerce').to_numpy(dtype=np.float64)
+    chunk['final_price'] = np.char.mod('$%.2f', prices)
+    chunk['discount'] = chunk['discount'].fillna('$0')
+    return chunk
+
+
+def iter_catalog_batches(csv_path: str, chunksize: int = 10000, batch_size: int = 96,
+                         limit: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Stream cleaned product records from the catalog CSV in batches.
+
+    The CSV is read chunksize rows at a time, so memory stays flat however
+    large the file is. Each record's vector ID is its catalog product_id,
+    so adding or removing a product never changes the ID of another one and
+    incremental syncs only touch the products that changed.
+    Args:
+        csv_path: Path to the catalog CSV
+        chunksize: Rows parsed per chunk
+        batch_size: Records per yielded batch
+        limit: Stop after this many products
+    """
+    count = 0
+    reader = pd.read_csv(csv_path, usecols=CATALOG_COLUMNS, chunksize=chunksize)
+    for chunk in reader:
+        records = clean_chunk(chunk).to_dict('records')
+        if limit is not None:
+            records = records[:max(limit - count, 0)]
+        for record in records:
+            record['id'] = record['product_id']
+        count += len(records)
+        for pos in range(0, len(records), batch_size):
+            yield records[pos:pos + batch_size]
+        if limit is not None and count >= limit:
+            return
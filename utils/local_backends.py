@@ -0,0 +1,216 @@
+"""
+In-process stand-ins for OpenAI, DynamoDB and the vector database, so the
+agent can be run, stress tested and benchmarked locally without any
+credentials or network access.
+
+Run `python -m utils.local_backends` for a concurrency stress run.
+"""
+from typing import Dict, Any, List, Optional
+import copy
+import json
+import random
+import threading
+import time
+import uuid
+from openai.types.chat import ChatCompletion
+from schemas import Get_Product_Recommendations, Add_To_Cart, Shipment_Details, Calculate_Total_Price, Complete_Purchase, Get_Order_Details
+from utils.add_to_cart import add_to_cart
+from utils.shipment_details import shipment_details
+from utils.complete_purchase import complete_purchase
+from utils.calculate_total_price import calculate_total_price
+from utils.get_order_details import get_order_details
+from utils.tools import ToolRegistry
+from utils.cart import CartStore
+from utils.gazetteer import Gazetteer
+
+# Primary key attribute of each DynamoDB table
+TABLE_KEYS = {'sessions': 'session_id', 'orders': 'order_id', 'carts': 'session_id'}
+
+LOCAL_CATALOG = [
+    {"product_id": 1001, "product_name": "Matte Lipstick", "root_category_name": "Beauty", "brand": "Glow", "final_price": "$9.99", "discount": "$1.00", "rating": 4.4, "description": "Long lasting matte lipstick in ruby red"},
+    {"product_id": 1002, "product_name": "Running Shoes", "root_category_name": "Sports", "brand": "Stride", "final_price": "$49.99", "discount": "$5.00", "rating": 4.6, "description": "Lightweight running shoes with cushioned soles"},
+    {"product_id": 1003, "product_name": "Coffee Maker", "root_category_name": "Home", "brand": "Brew", "final_price": "$29.99", "discount": "$0", "rating": 4.1, "description": "12 cup drip coffee maker with timer"},
+]
+
+
+class LocalDynamoDB:
+    """Thread-safe, in-memory subset of the low-level DynamoDB client API"""
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def get_item(self, TableName: str, Key: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        key = json.dumps(Key, sort_keys=True)
+        with self._lock:
+            item = self.tables.get(TableName, {}).get(key)
+            return {'Item': copy.deepcopy(item)} if item is not None else {}
+
+    def put_item(self, TableName: str, Item: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        key_name = TABLE_KEYS[TableName]
+        key = json.dumps({key_name: Item[key_name]}, sort_keys=True)
+        with self._lock:
+            self.tables.setdefault(TableName, {})[key] = copy.deepcopy(Item)
+        return {}
+
+    def update_item(self, TableName: str, Key: Dict[str, Any], UpdateExpression: str,
+                    ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+                    ExpressionAttributeValues: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        """Supports the plain "SET #a = :a, ..." and "REMOVE #a, ..." forms"""
+        time.sleep(self.latency)
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        action, _, clauses = UpdateExpression.strip().partition(" ")
+        key = json.dumps(Key, sort_keys=True)
+        with self._lock:
+            item = self.tables.setdefault(TableName, {}).setdefault(key, copy.deepcopy(Key))
+            for clause in clauses.split(","):
+                if action.upper() == "SET":
+                    name, _, value = clause.partition("=")
+                    item[names.get(name.strip(), name.strip())] = copy.deepcopy(values[value.strip()])
+                elif action.upper() == "REMOVE":
+                    item.pop(names.get(clause.strip(), clause.strip()), None)
+                else:
+                    raise ValueError(f"Unsupported update expression: {UpdateExpression}")
+        return {}
+
+    def delete_item(self, TableName: str, Key: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        with self._lock:
+            self.tables.get(TableName, {}).pop(json.dumps(Key, sort_keys=True), None)
+        return {}
+
+
+class LocalCatalog:
+    """Product lookups against LOCAL_CATALOG"""
+    def get_product(self, product_id: int) -> Optional[Dict[str, Any]]:
+        return next((p for p in LOCAL_CATALOG if p["product_id"] == int(product_id)), None)
+
+
+class LocalLLM:
+    """
+    Scripted chat completions client. A user message that asks for products
+    gets a get_product_recommendations call, everything else gets an answer
+    that quotes the user's last message, which lets callers check that turns
+    never see each other's history.
+    """
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.chat = self
+        self.completions = self
+
+    def create(self, model: str, messages: List[Dict[str, Any]], **kwargs) -> ChatCompletion:
+        time.sleep(self.latency + random.random() * self.jitter)
+        last = messages[-1]
+        user_query = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        message: Dict[str, Any] = {"role": "assistant", "content": None}
+        if last["role"] == "user" and "find" in last["content"].lower():
+            message["tool_calls"] = [{
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": "get_product_recommendations", "arguments": json.dumps({"query_text": last["content"]})}
+            }]
+        else:
+            message["content"] = f"Answer to: {user_query}"
+        return ChatCompletion.model_validate({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": message}],
+            "usage": {"prompt_tokens": 10 * len(messages), "completion_tokens": 10, "total_tokens": 10 * len(messages) + 10},
+        })
+
+
+def get_product_recommendations(query_text: str) -> str:
+    """
+    Query the vector database for various products that are similar to the query text
+    """
+    words = set(query_text.lower().split())
+    matches = [p for p in LOCAL_CATALOG if words & set(p["description"].lower().split())] or LOCAL_CATALOG
+    return "\n\n".join(
+        "\n".join(f"{k}: {v}" for k, v in product.items()) for product in matches
+    )
+
+
+def build_local_tools(dynamodb: Optional[LocalDynamoDB] = None) -> ToolRegistry:
+    """Tool registry backed by the local catalog instead of Pinecone"""
+    dynamodb = dynamodb or LocalDynamoDB()
+    tools = ToolRegistry()
+    tools.add_resource("dynamodb", dynamodb)
+    tools.add_resource("cart", CartStore(dynamodb, catalog=LocalCatalog()))
+    tools.add_resource("gazetteer", Gazetteer(routing_url=""))
+    tools.register(get_product_recommendations, Get_Product_Recommendations)
+    tools.register(add_to_cart, Add_To_Cart)
+    tools.register(shipment_details, Shipment_Details)
+    tools.register(calculate_total_price, Calculate_Total_Price)
+    tools.register(complete_purchase, Complete_Purchase)
+    tools.register(get_order_details, Get_Order_Details)
+    return tools
+
+
+def build_local_agent(llm_latency: float = 0.0, db_latency: float = 0.0):
+    """Agent wired to the local stand-ins"""
+    from agent import Agent
+    dynamodb = LocalDynamoDB(latency=db_latency)
+    return Agent(tools=build_local_tools(dynamodb), client=LocalLLM(latency=llm_latency, jitter=llm_latency), dynamodb=dynamodb)
+
+
+def stress(threads: int = 32, sessions: int = 64, turns: int = 5) -> None:
+    """
+    Run many conversations concurrently on one Agent and check that histories
+    stay isolated, then check out every session's cart through the UI actions.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    agent = build_local_agent(llm_latency=0.002, db_latency=0.001)
+
+    def checkout(n: int) -> None:
+        session_id = f"session-{n}"
+        product = LOCAL_CATALOG[n % len(LOCAL_CATALOG)]
+        agent.tools.call_function("add_to_cart", {"product_id": product["product_id"], "quantity": n % 3 + 1}, session_id=session_id)
+
+        action = {"type": "calculate_total", "destination": "Mumbai, India", "shipment_distance": float(n)}
+        summary = agent.run({"session_id": session_id, "action": action})["response"]
+        assert product["product_name"] in summary, summary
+        total = float(summary.split("**Total: $")[1].split("**")[0])
+
+        receipt = agent.run({"session_id": session_id, "action": {"type": "complete_purchase"}})["response"]
+        assert receipt.startswith("Order has been placed successfully!"), receipt
+        assert float(receipt.split("Total cost: ")[1].split(". ")[0]) == total, receipt
+        order_id = int(receipt.split("Order ID: ")[1].split(",")[0])
+        assert agent.dynamodb.get_item(TableName='orders', Key={'order_id': {'N': str(order_id)}}).get('Item'), order_id
+        assert not agent.dynamodb.get_item(TableName='carts', Key={'session_id': {'S': session_id}}).get('Item')
+
+        messages = agent.dynamodb.get_item(TableName='sessions', Key={'session_id': {'S': session_id}})['Item']['messages']['L']
+        calls = {json.loads(tc['S'])['id'] for m in messages for tc in m['M'].get('tool_calls', {}).get('L', [])}
+        answered = {m['M']['tool_call_id']['S'] for m in messages if 'tool_call_id' in m['M']}
+        assert calls == answered, calls ^ answered
+
+    def conversation(n: int) -> None:
+        session_id = f"session-{n}"
+        for t in range(turns):
+            query = f"find shoes for {session_id} turn {t}" if t % 2 == 0 else f"thanks {session_id} turn {t}"
+            result = agent.run({"session_id": session_id, "user_query": query})
+            assert result["session_id"] == session_id
+            assert result["response"] == f"Answer to: {query}", result["response"]
+            for tool in result["tools_used"]:
+                assert tool["args"]["query_text"] == query
+
+        item = agent.dynamodb.get_item(TableName='sessions', Key={'session_id': {'S': session_id}})['Item']
+        contents = [m['M']['content']['S'] for m in item['messages']['L'] if m['M']['role']['S'] == 'user']
+        assert len(contents) == turns and all(session_id in c for c in contents), contents
+        checkout(n)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(conversation, range(sessions)))
+    elapsed = time.perf_counter() - started
+    print(f"{sessions * turns} turns and {sessions} checkouts across {sessions} sessions on {threads} threads in {elapsed:.2f}s, histories isolated")
+
+
+if __name__ == "__main__":
+    stress()
@@ -1,28 +1,99 @@
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
+import reprlib
+
+_LEVELS = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR,
+    'CRITICAL': logging.CRITICAL,
+}
+
+_queue = queue.SimpleQueue()
+_listener = None
+_stream_handler = None
+
+
+def _get_stream_handler() -> logging.Handler:
+    """Return the process wide handler writing formatted records to stderr"""
+    global _stream_handler
+    if _stream_handler is None:
+        _stream_handler = logging.StreamHandler()
+        _stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    return _stream_handler
 
-class CustomLogger:
-    def __init__(self, logger_name='custom_logger'):
-        self.logger = logging.getLogger(logger_name)
-        self.logger.setLevel(logging.DEBUG)
 
-        ch = logging.StreamHandler()
-        ch.setLevel(logging.DEBUG)
+def _get_handler() -> logging.Handler:
+    """
+    Return the handler for a logger, which hands records to a background
+    writer thread so callers never wait on the stream. Lambda freezes
+    background threads as soon as the handler returns and never runs
+    atexit, so queued lines would show up under the next request or be
+    lost; there records are written synchronously instead.
+    """
+    global _listener
+    if os.getenv('AWS_LAMBDA_FUNCTION_NAME'):
+        return _get_stream_handler()
+    if _listener is None:
+        _listener = logging.handlers.QueueListener(_queue, _get_stream_handler(), respect_handler_level=False)
+        _listener.start()
+        atexit.register(_listener.stop)
+    return logging.handlers.QueueHandler(_queue)
 
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-        ch.setFormatter(formatter)
+class Payload:
+    """
+    Wraps a log argument so that it is only rendered when the record is
+    actually emitted, and never rendered past max_chars.
+    """
+    _repr = reprlib.Repr()
+    _repr.maxlevel = 4
+    _repr.maxdict = 20
+    _repr.maxlist = 20
+    _repr.maxother = 200
 
-        self.logger.addHandler(ch)
+    def __init__(self, value, max_chars: int = None):
+        self.value = value
+        self.max_chars = max_chars or int(os.getenv('LOG_MAX_PAYLOAD_CHARS', 2000))
+
+    def __str__(self):
+        value = self.value
+        if isinstance(value, BaseException):
+            value = str(value)
+        if isinstance(value, str):
+            text = value[:self.max_chars + 1]
+        else:
+            self._repr.maxstring = self.max_chars
+            text = self._repr.repr(value)
+        if len(text) > self.max_chars:
+            text = text[:self.max_chars] + '...<truncated>'
+        return text
+
+    __repr__ = __str__
+
+
+class CustomLogger:
+    def __init__(self, logger_name='custom_logger'):
+        self.logger = logging.getLogger(logger_name)
+        self.logger.setLevel(_LEVELS.get(os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO))
+        self.logger.propagate = False
 
+        # Loggers are process wide, only attach the handler the first time
+        if not self.logger.handlers:
+            self.logger.addHandler(_get_handler())
 
-    def log_trace(self, message, level='INFO'):
-        if level == 'DEBUG':
-            self.logger.debug(message)
-        elif level == 'INFO':
-            self.logger.info(message)
-        elif level == 'WARNING':
-            self.logger.warning(message)
-        elif level == 'ERROR':
-            self.logger.error(message)
-        elif level == 'CRITICAL':
-            self.logger.critical(message)
+    def log_trace(self, message, *args, level='INFO'):
+        """
+        Log a %-style message. Arguments are formatted lazily and only when
+        the level is enabled, and each argument is size capped.
+        """
+        levelno = _LEVELS.get(level, logging.INFO)
+        if not self.logger.isEnabledFor(levelno):
+            return
+        if args:
+            args = tuple(a if isinstance(a, (int, float)) else Payload(a) for a in args)
+        self.logger.log(levelno, message, *args)
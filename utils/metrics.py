@@ -0,0 +1,183 @@
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Iterator
+from contextlib import contextmanager
+import contextvars
+import json
+import os
+import sys
+import time
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    duration_ms: float = 0.0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+@dataclass
+class TurnMetrics:
+    """All spans and counters recorded while serving a single agent turn"""
+    name: str
+    start: float = field(default_factory=time.time)
+    duration_ms: float = 0.0
+    spans: List[Span] = field(default_factory=list)
+    counters: Dict[str, float] = field(default_factory=dict)
+    properties: Dict[str, Any] = field(default_factory=dict)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def timings(self) -> Dict[str, float]:
+        """Total milliseconds spent per span name"""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms
+        return totals
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "turn": self.name,
+            "timestamp": self.start,
+            "duration_ms": round(self.duration_ms, 3),
+            "counters": self.counters,
+            "timings_ms": {k: round(v, 3) for k, v in self.timings().items()},
+            "spans": [
+                {
+                    "name": s.name,
+                    "offset_ms": round((s.start - self.start) * 1000, 3),
+                    "duration_ms": round(s.duration_ms, 3),
+                    "attributes": s.attributes,
+                    "error": s.error,
+                }
+                for s in self.spans
+            ],
+            "properties": self.properties,
+        }
+
+
+class MetricsExporter:
+    """Default exporter, drops everything"""
+    def export(self, turn: TurnMetrics) -> None:
+        pass
+
+
+class JsonExporter(MetricsExporter):
+    """Writes one structured JSON line per turn"""
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def export(self, turn: TurnMetrics) -> None:
+        self.stream.write(json.dumps(turn.to_dict(), default=str) + "\n")
+        self.stream.flush()
+
+
+class EMFExporter(MetricsExporter):
+    """
+    Writes CloudWatch Embedded Metric Format lines, which Lambda turns into
+    metrics straight from stdout without any API calls.
+    """
+    def __init__(self, namespace: str = "ShoppingAssistant", service: str = "agent", stream=None):
+        self.namespace = namespace
+        self.service = service
+        self.stream = stream or sys.stdout
+
+    def export(self, turn: TurnMetrics) -> None:
+        values: Dict[str, float] = {"turn_latency": turn.duration_ms}
+        definitions = [{"Name": "turn_latency", "Unit": "Milliseconds"}]
+        for name, total in turn.timings().items():
+            values[f"{name}_latency"] = total
+            definitions.append({"Name": f"{name}_latency", "Unit": "Milliseconds"})
+        for name, value in turn.counters.items():
+            values[name] = value
+            definitions.append({"Name": name, "Unit": "Count"})
+
+        payload = {
+            "_aws": {
+                "Timestamp": int(turn.start * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [["Service"]],
+                    "Metrics": definitions,
+                }],
+            },
+            "Service": self.service,
+            "turn": turn.name,
+            **{k: v for k, v in turn.properties.items() if k not in values},
+            **values,
+        }
+        self.stream.write(json.dumps(payload, default=str) + "\n")
+        self.stream.flush()
+
+
+class Tracer:
+    """
+    Records spans and counters for the turn active in the current context.
+
+    The active turn is kept in a context variable, so concurrent turns on
+    different threads never see each other's spans. Spans and counters
+    recorded outside of a turn are dropped.
+    """
+    def __init__(self, exporter: Optional[MetricsExporter] = None):
+        self.exporter = exporter or MetricsExporter()
+        self._current: contextvars.ContextVar = contextvars.ContextVar("current_turn", default=None)
+
+    @property
+    def current(self) -> Optional[TurnMetrics]:
+        return self._current.get()
+
+    @contextmanager
+    def turn(self, name: str, **properties) -> Iterator[TurnMetrics]:
+        """Start a new turn, exporting it when the block exits"""
+        turn = TurnMetrics(name=name, properties=dict(properties))
+        token = self._current.set(turn)
+        started = time.perf_counter()
+        try:
+            yield turn
+        finally:
+            turn.duration_ms = (time.perf_counter() - started) * 1000
+            self._current.reset(token)
+            try:
+                self.exporter.export(turn)
+            except Exception:
+                # Metrics must never fail a request
+                pass
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """Time the enclosed block as a span of the current turn"""
+        turn = self._current.get()
+        if turn is None:
+            yield None
+            return
+        span = Span(name=name, start=time.time(), attributes=dict(attributes))
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration_ms = (time.perf_counter() - started) * 1000
+            turn.spans.append(span)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """Increment a counter of the current turn"""
+        turn = self._current.get()
+        if turn is not None:
+            turn.incr(name, value)
+
+
+def get_exporter(name: Optional[str] = None) -> MetricsExporter:
+    """Build the exporter selected by name or by the METRICS_EXPORTER env var"""
+    name = (name or os.getenv("METRICS_EXPORTER", "none")).lower()
+    if name == "json":
+        return JsonExporter()
+    elif name == "emf":
+        return EMFExporter(namespace=os.getenv("METRICS_NAMESPACE", "ShoppingAssistant"))
+    return MetricsExporter()
+
+
+tracer = Tracer(get_exporter())
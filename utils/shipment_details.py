@@ -1,4 +1,14 @@
+from typing import Optional
+from utils.cart import CartStore
+from utils.gazetteer import Gazetteer
 
-def shipment_details(destination: str):
+def shipment_details(destination: str, session_id: str, cart: CartStore, gazetteer: Gazetteer) -> Optional[str]:
     "Accepts the destination name for shipping the order to calculate the shipment distance required for delivery charge calculation"
-    return 
+    place = gazetteer.resolve(destination)
+    if place is None:
+        # Unknown to the gazetteer, the UI geocodes and routes it instead
+        return None
+
+    cart.set_shipment(session_id, place["distance_km"], place["destination"])
+    kind = "road route" if place["source"] == "route" else "estimated road distance"
+    return f"The shipment needs to be delivered to {place['destination']}. The calculated distance: {place['distance_km']:.2f} km ({kind})."
@@ -0,0 +1,121 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Optional
+import contextvars
+import os
+import re
+import threading
+from utils.logger import CustomLogger
+from utils.metrics import tracer
+
+logger = CustomLogger('speculation')
+
+# Words that say a message is asking for products
+SEARCH_WORDS = frozenset({
+    "find", "search", "show", "recommend", "recommendation", "recommendations", "suggest", "suggestions",
+    "looking", "look", "want", "need", "buy", "shop", "browse", "options", "any", "best", "cheap",
+})
+# Words of checkout and order messages, which never need a product search
+CHECKOUT_WORDS = frozenset({
+    "cart", "total", "cost", "purchase", "checkout", "order", "pay", "payment", "ship", "shipment",
+    "deliver", "delivery", "quantity",
+})
+# Filler words left out when comparing the user's message to the LLM's query
+STOP_WORDS = frozenset({
+    "a", "an", "the", "i", "me", "my", "we", "us", "you", "can", "could", "would", "will", "please",
+    "some", "for", "of", "to", "with", "in", "on", "and", "or", "is", "are", "do", "does", "am",
+    "that", "this", "it", "be", "get", "give", "have", "has", "there", "what", "which", "im", "id",
+}) | SEARCH_WORDS
+
+
+def content_words(text: str) -> frozenset:
+    return frozenset(w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOP_WORDS)
+
+
+def looks_like_product_search(text: str) -> bool:
+    words = set(re.findall(r"[a-z]+", text.lower()))
+    return bool(words & SEARCH_WORDS) and not words & CHECKOUT_WORDS and bool(content_words(text))
+
+
+def query_similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the content words of two queries"""
+    a, b = content_words(a), content_words(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class Speculation:
+    """A product search started from the user's message before the LLM asked for it"""
+    def __init__(self, tool_name: str, query_text: str, future: Future, threshold: float):
+        self.tool_name = tool_name
+        self.query_text = query_text
+        self.future = future
+        self.threshold = threshold
+        self.claimed = False
+
+    def claim(self, name: str, args: Dict[str, Any], timeout: Optional[float] = None) -> Optional[Any]:
+        """The prefetched result if this call asks for (nearly) the same search, None otherwise"""
+        if self.claimed or name != self.tool_name:
+            return None
+        self.claimed = True
+        query_text = args.get("query_text", "")
+        if query_similarity(self.query_text, query_text) < self.threshold:
+            tracer.incr("speculation_misses")
+            logger.log_trace("Speculative search not used, %r vs %r", self.query_text, query_text, level="DEBUG")
+            self.future.cancel()
+            return None
+        if self.future.cancel():
+            # Still queued behind other searches, running it now is faster than waiting
+            tracer.incr("speculation_queued")
+            return None
+        try:
+            result = self.future.result(timeout=timeout)
+        except Exception as e:
+            tracer.incr("speculation_errors")
+            logger.log_trace("Speculative search failed: %s", e, level="WARNING")
+            return None
+        tracer.incr("speculation_hits")
+        return result
+
+    def discard(self) -> None:
+        """End of the turn, counts the search as wasted if nothing claimed it"""
+        if not self.claimed:
+            self.claimed = True
+            self.future.cancel()
+            tracer.incr("speculation_wasted")
+
+
+class Speculator:
+    """
+    Starts the product search for messages that look like one on a thread
+    pool, so it runs while the first LLM call decides what to do. The run
+    shares the turn's metrics context, so its spans show up in the turn.
+    No search is started while every worker is busy, as a queued search
+    would only make the turn wait longer than running the tool itself.
+    """
+    def __init__(self, workers: int = 4, tool_name: str = "get_product_recommendations",
+                 threshold: Optional[float] = None):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speculation")
+        self.workers = workers
+        self.tool_name = tool_name
+        self.threshold = threshold if threshold is not None else float(os.getenv("SPECULATION_THRESHOLD", 0.8))
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def start(self, tools, user_query: str) -> Optional[Speculation]:
+        if tools.get_function(self.tool_name) is None or not looks_like_product_search(user_query):
+            return None
+        with self._lock:
+            if self._in_flight >= self.workers:
+                tracer.incr("speculation_skipped")
+                return None
+            self._in_flight += 1
+        context = contextvars.copy_context()
+        future = self.executor.submit(context.run, tools.call_function, self.tool_name, {"query_text": user_query})
+        future.add_done_callback(self.__done)
+        tracer.incr("speculation_started")
+        return Speculation(self.tool_name, user_query, future, self.threshold)
+
+    def __done(self, future: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
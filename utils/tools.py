@@ -1,13 +1,19 @@
 from typing import Dict, Any, Callable, Tuple, Optional
+from types import MappingProxyType
 from pydantic import BaseModel
 from openai import pydantic_function_tool
 import inspect
+from utils.metrics import tracer
 
 class ToolRegistry:
     """A registry class to manage tools and their schemas"""
     def __init__(self):
         self.schemas: Dict[str, BaseModel] = {}
         self.functions: Dict[str, Callable] = {}
+        # Shared objects (stores, clients) handed to tools that declare a parameter of the same name
+        self.resources: Dict[str, Any] = {}
+        self.parameters: Dict[str, frozenset] = {}
+        self.frozen = False
     
     def register(self, func: Callable, schema: BaseModel) -> None:
         """
@@ -17,9 +23,30 @@ class ToolRegistry:
             func: The function to register
             schema: The pydantic model schema for the function
         """
+        if self.frozen:
+            raise RuntimeError(f"Cannot register {func.__name__}, the registry is frozen")
         self.schemas[func.__name__] = schema
         self.functions[func.__name__] = func
+        self.parameters[func.__name__] = frozenset(inspect.signature(func).parameters)
+
+    def add_resource(self, name: str, resource: Any) -> None:
+        """Make a shared object available to every tool with a parameter called name"""
+        if self.frozen:
+            raise RuntimeError(f"Cannot add resource {name}, the registry is frozen")
+        self.resources[name] = resource
+
+    def get_resource(self, name: str) -> Any:
+        """Get a shared resource by name"""
+        return self.resources.get(name)
     
+    def freeze(self) -> None:
+        """Make the registry read-only, so it can be shared between threads"""
+        self.schemas = MappingProxyType(dict(self.schemas))
+        self.functions = MappingProxyType(dict(self.functions))
+        self.resources = MappingProxyType(dict(self.resources))
+        self.parameters = MappingProxyType(dict(self.parameters))
+        self.frozen = True
+
     def get_schema(self, name: str) -> BaseModel:
         """Get schema by function name"""
         return self.schemas.get(name)
@@ -28,10 +55,17 @@ class ToolRegistry:
         """Get function by name"""
         return self.functions.get(name)
     
-    def call_function(self, name: str, args: dict) -> Any:
-        """Call a function by name with arguments"""
+    def call_function(self, name: str, args: dict, **context) -> Any:
+        """
+        Call a function by name with arguments.
+        Resources and per-call context (e.g. session_id) are passed to the
+        function only if it declares a parameter with that name.
+        """
         func = self.get_function(name)
-        return func(**args)
+        accepted = self.parameters[name]
+        injected = {k: v for k, v in {**self.resources, **context}.items() if k in accepted}
+        with tracer.span(f"tool.{name}"):
+            return func(**args, **injected)
     
     def generate_openai_schema(self, func: Callable) -> dict:
         """Generate OpenAI compatible schema for a function"""
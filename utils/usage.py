@@ -0,0 +1,70 @@
+from typing import Dict, Any, Optional
+import time
+from utils.metrics import TurnMetrics
+
+# USD per 1M tokens: (prompt, cached prompt, completion)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+}
+
+# Running totals kept on the session item
+SESSION_TOTALS = ("turns", "llm_steps", "prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd")
+
+
+def model_prices(model: str) -> Optional[tuple]:
+    """Prices of the model, matching dated snapshots like gpt-4o-2024-08-06 by their longest known prefix"""
+    matches = [name for name in MODEL_PRICES if model.startswith(name)]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+def llm_cost(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float:
+    """USD cost of one LLM call, 0 for models without a known price"""
+    prices = model_prices(model)
+    if prices is None:
+        return 0.0
+    prompt, cached, completion = prices
+    return ((prompt_tokens - cached_tokens) * prompt + cached_tokens * cached + completion_tokens * completion) / 1_000_000
+
+
+def turn_usage(turn: TurnMetrics) -> Dict[str, Any]:
+    """Compact usage block of a turn: LLM steps, tokens, cost, models and where the time went"""
+    counters = turn.counters
+    timings = turn.timings()
+
+    def total(prefix: str) -> float:
+        return round(sum(ms for name, ms in timings.items() if name.startswith(prefix)), 1)
+
+    models = []
+    for span in turn.spans:
+        if span.name == "llm" and span.error is None and span.attributes.get("model") not in models:
+            models.append(span.attributes.get("model"))
+    return {
+        "llm_steps": int(counters.get("llm_steps", 0)),
+        "prompt_tokens": int(counters.get("llm_prompt_tokens", 0)),
+        "completion_tokens": int(counters.get("llm_completion_tokens", 0)),
+        "cached_tokens": int(counters.get("llm_cached_tokens", 0)),
+        "cost_usd": round(counters.get("llm_cost_usd", 0.0), 6),
+        "models": models,
+        "fallbacks": int(counters.get("llm_fallbacks", 0)),
+        "latency_ms": {
+            "total": round((time.time() - turn.start) * 1000, 1),
+            "llm": total("llm"),
+            "tools": total("tool."),
+            "retrieval": total("vector_db."),
+            "session": total("session_"),
+            "cart": total("cart_"),
+        },
+    }
+
+
+def add_to_totals(totals: Dict[str, float], usage: Dict[str, Any]) -> Dict[str, float]:
+    """Session totals after adding one turn's usage"""
+    updated = {key: totals.get(key, 0) for key in SESSION_TOTALS}
+    updated["turns"] += 1
+    for key in SESSION_TOTALS[1:]:
+        updated[key] += usage[key]
+    updated["cost_usd"] = round(updated["cost_usd"], 6)
+    return updated
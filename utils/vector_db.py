@@ -1,8 +1,15 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Dict, Any, Optional
 from pinecone.grpc import PineconeGRPC as Pinecone
 from pinecone import ServerlessSpec
 from utils.logger import CustomLogger
+from utils.metrics import tracer
+from utils.category_router import CategoryRouter, CentroidAccumulator, CENTROIDS_NAMESPACE, namespace_for
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import math
+import os
+import threading
 import time
 import traceback
 
@@ -17,13 +24,37 @@ class VectorDBConfig:
     metric: str = "cosine"
     cloud: str = "aws"
     region: str = "us-east-1"
+    # Minimum seconds between embedding calls, to stay under the inference rate limit
+    embed_interval: float = 2.0
+    # Recently recommended products kept for cart price lookups, and for how many
+    # seconds, so prices changed by a catalog sync are picked up
+    product_cache_size: int = 5000
+    product_cache_ttl: float = field(default_factory=lambda: float(os.getenv("PRODUCT_CACHE_TTL", 300)))
+    # One namespace per root category, with queries routed to the closest partitions
+    partition_by_category: bool = field(default_factory=lambda: os.getenv("CATALOG_PARTITIONED", "false").lower() == "true")
+    max_partitions_searched: int = 2
+    # Best routing score (centroid cosine plus keyword bonus) needed to skip searching every partition
+    route_min_score: float = 0.75
 
 class VectorDB:
     def __init__(self, config: VectorDBConfig):
         self.config = config
         self.pc = Pinecone(api_key=config.api_key)
         self.index = None
+        self._last_embed = 0.0
+        self._products = OrderedDict()
+        self._products_lock = threading.Lock()
         self.__initialize_index()
+        self.router = None
+        self.centroids = None
+        if config.partition_by_category:
+            self.router = CategoryRouter(self.index, config.dimension, max_partitions=config.max_partitions_searched,
+                                         min_score=config.route_min_score)
+            self.centroids = CentroidAccumulator(config.dimension)
+            self._query_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="partition-query")
+            self._namespaces: List[str] = []
+            self._namespaces_at = -math.inf
+            self._namespaces_lock = threading.Lock()
 
     def __initialize_index(self) -> None:
         """Initialize or connect to existing Pinecone index"""
@@ -44,53 +75,136 @@ class VectorDB:
 
             self.index = self.pc.Index(self.config.index_name)
         except Exception as e:
-            logger.error(f"Error initializing Pinecone index: {e}", level='ERROR')
+            logger.log_trace("Error initializing Pinecone index: %s", e, level='ERROR')
             traceback.print_exc()
             raise e
 
 
-    def upsert_data(self, data: List[Dict[str, Any]]) -> None:
+    def embed_passages(self, texts: List[str]) -> List[List[float]]:
+        """Embed catalog texts in batches of config.batch_size"""
+        values = []
+        for i in range(0, len(texts), self.config.batch_size):
+            wait = self._last_embed + self.config.embed_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            batch = texts[i:i+self.config.batch_size]
+            with tracer.span("vector_db.embed", inputs=len(batch)):
+                embeddings = self.pc.inference.embed(
+                    model="multilingual-e5-large",
+                    inputs=batch,
+                    parameters={
+                        "input_type": "passage",
+                        "truncate": "END"
+                    }
+                )
+            self._last_embed = time.monotonic()
+            values.extend(emb["values"] for emb in embeddings)
+        return values
+
+    def namespace_of(self, metadata: Dict[str, Any]) -> str:
+        """Namespace a product is stored in"""
+        return namespace_for(metadata) if self.config.partition_by_category else ""
+
+    def upsert_records(self, records: List[Dict[str, Any]], namespace: Optional[str] = None) -> None:
+        """Upsert already embedded records in parallel chunks, each into its product's namespace unless one is given"""
+        def chunker(seq, batch_size):
+            return (seq[pos:pos + batch_size] for pos in range(0, len(seq), batch_size))
+
+        groups = defaultdict(list)
+        for record in records:
+            groups[namespace if namespace is not None else self.namespace_of(record["metadata"])].append(record)
+
+        async_results = [
+            self.index.upsert(vectors=chunk, namespace=group_namespace, async_req=True)
+            for group_namespace, group in groups.items()
+            for chunk in chunker(group, batch_size=200)
+        ]
+
+        # Wait for and retrieve responses
+        [async_result.result() for async_result in async_results]
+
+    def delete_records(self, ids: List[str], namespace: str = "") -> None:
+        """Delete records by ID"""
+        for pos in range(0, len(ids), 1000):
+            self.index.delete(ids=ids[pos:pos + 1000], namespace=namespace)
+
+    def write_centroids(self, centroids: Optional[CentroidAccumulator] = None, replace: bool = False) -> None:
+        """
+        Store the partition centroids used for query routing
+        Args:
+            centroids: Centroids to store, by default those of everything upserted since the last write
+            replace: The centroids cover the whole catalog, so they replace the stored ones
+                and centroids of partitions missing from them are deleted. Otherwise they are
+                merged into the stored centroids and every other partition is left alone.
+        """
+        if centroids is None:
+            centroids, self.centroids = self.centroids, CentroidAccumulator(self.config.dimension)
+        stored = self.router.fetch()
+        if replace:
+            records = centroids.records()
+            stale = {m["id"] for m in stored} - {r["id"] for r in records}
+        else:
+            records = centroids.records(stored)
+            stale = set()
+        self.upsert_records(records, namespace=CENTROIDS_NAMESPACE)
+        if stale:
+            self.delete_records(list(stale), namespace=CENTROIDS_NAMESPACE)
+        self.router.load()
+        logger.log_trace("Wrote %s category centroids", len(records), level='INFO')
+
+    def upsert_data(self, data: List[Dict[str, Any]], write_centroids: bool = True) -> None:
         """
         Upsert data into the vector database
         Args:
             data: List of dictionaries containing product information
+            write_centroids: Merge the partition centroids of everything upserted since the last
+                write into the stored ones, callers streaming many batches can pass False and
+                call write_centroids() once
         """
         try:
-            records = []
             for i in range(0, len(data), self.config.batch_size):
                 batch = data[i:i+self.config.batch_size]
-                embeddings = self.pc.inference.embed(
-                    model="multilingual-e5-large",
-                    inputs=[d["description"] for d in batch],
-                    parameters={
-                        "input_type": "passage",
-                        "truncate": "END"
-                    }
-                )
-                for doc, emb in zip(batch, embeddings):
+                embeddings = self.embed_passages([d["description"] for d in batch])
+                records = []
+                for doc, values in zip(batch, embeddings):
                     doc_copy = doc.copy()
                     id = doc_copy.pop("id")
                     records.append({
                         "id": str(id),
-                        "values": emb["values"],
+                        "values": values,
                         "metadata": doc_copy
                     })
-                time.sleep(2)
-
-            # Batch upsert records
-            def chunker(seq, batch_size):
-                return (seq[pos:pos + batch_size] for pos in range(0, len(seq), batch_size))
+                    if self.centroids is not None:
+                        self.centroids.add(doc_copy, values)
+                self.upsert_records(records)
+            if self.centroids is not None and write_centroids:
+                self.write_centroids()
+            logger.log_trace("Data upserted successfully", level='INFO')
+        except Exception as e:
+            logger.log_trace("Error upserting data into Pinecone index: %s", e, level='ERROR')
+            traceback.print_exc()
+            raise e
 
-            async_results = [
-                self.index.upsert(vectors=chunk, async_req=True)
-                for chunk in chunker(records, batch_size=200)
-            ]
+    def sync_data(self, data: List[Dict[str, Any]], snapshot_dir: str) -> Dict[str, int]:
+        """
+        Incrementally sync data into the vector database, embedding only new or
+        changed products and deleting products that are no longer in data.
+        Args:
+            data: List of dictionaries containing the full product catalog, each "id" a
+                stable product key such as product_id; repeated IDs are skipped
+            snapshot_dir: Directory holding the snapshot of the last sync
+        """
+        from utils.catalog_snapshot import CatalogSync
 
-            # Wait for and retrieve responses
-            [async_result.result() for async_result in async_results]
-            logger.log_trace("Data upserted successfully", level='INFO')
+        try:
+            sync = CatalogSync(self, snapshot_dir)
+            for i in range(0, len(data), self.config.batch_size):
+                sync.sync_batch(data[i:i+self.config.batch_size])
+            stats = sync.finalize()
+            logger.log_trace("Data synced successfully: %s", stats, level='INFO')
+            return stats
         except Exception as e:
-            logger.error(f"Error upserting data into Pinecone index: {e}", level='ERROR')
+            logger.log_trace("Error syncing data into Pinecone index: %s", e, level='ERROR')
             traceback.print_exc()
             raise e
 
@@ -100,22 +214,28 @@ class VectorDB:
         
         """
         try:
-            query_embedding = self.pc.inference.embed(
-                model="multilingual-e5-large",
-                inputs=[query_text],
-                parameters={
-                    "input_type": "query"
-                }
-            )
-
-            results = self.index.query(
-                vector=query_embedding[0].values,
-                top_k=top_k,
-                include_values=False,
-                include_metadata=True
-            )
-            logger.log_trace(f"Search success", level='INFO')
-            matches = results["matches"]
+            with tracer.span("vector_db.embed"):
+                query_embedding = self.pc.inference.embed(
+                    model="multilingual-e5-large",
+                    inputs=[query_text],
+                    parameters={
+                        "input_type": "query"
+                    }
+                )
+
+            if self.router is not None:
+                matches = self.__query_partitions(query_text, query_embedding[0].values, top_k)
+            else:
+                with tracer.span("vector_db.query", top_k=top_k):
+                    results = self.index.query(
+                        vector=query_embedding[0].values,
+                        top_k=top_k,
+                        include_values=False,
+                        include_metadata=True
+                    )
+                matches = results["matches"]
+            logger.log_trace("Search success", level='INFO')
+            self.__remember_products(matches)
             if not run_reranking:
                 if reformat_results:
                     return self.__reformat_results(matches)
@@ -127,10 +247,43 @@ class VectorDB:
 
             return matches
         except Exception as e:
-            logger.error(f"Error querying Pinecone index: {e}", level='ERROR')
+            logger.log_trace("Error querying Pinecone index: %s", e, level='ERROR')
             traceback.print_exc()
             raise e
 
+    def __partition_namespaces(self) -> List[str]:
+        """Every product namespace in the index, refreshed from the index stats every few minutes"""
+        with self._namespaces_lock:
+            if time.monotonic() - self._namespaces_at < self.router.refresh_seconds:
+                return self._namespaces
+        namespaces = [ns for ns in self.get_stats()["namespaces"] if ns != CENTROIDS_NAMESPACE]
+        with self._namespaces_lock:
+            self._namespaces, self._namespaces_at = namespaces, time.monotonic()
+        return namespaces
+
+    def __query_namespaces(self, namespaces: List[str], top_k: int, **query) -> List[Dict[str, Any]]:
+        """Query namespaces concurrently and merge the matches by score"""
+        def run(namespace):
+            return self.index.query(namespace=namespace, top_k=top_k, include_values=False, include_metadata=True, **query)["matches"]
+
+        with tracer.span("vector_db.query", top_k=top_k, partitions=len(namespaces)):
+            results = list(self._query_pool.map(run, namespaces)) if len(namespaces) > 1 else [run(ns) for ns in namespaces]
+        tracer.incr("partitions_searched", len(namespaces))
+        matches = [match for result in results for match in result]
+        return sorted(matches, key=lambda match: match["score"], reverse=True)[:top_k]
+
+    def __query_partitions(self, query_text: str, vector: List[float], top_k: int) -> List[Dict[str, Any]]:
+        """Search the partitions the router picks, widening to all of them if those come up short"""
+        namespaces = self.router.route(query_text, vector) or self.__partition_namespaces()
+        matches = self.__query_namespaces(namespaces, top_k, vector=vector)
+        if len(matches) < top_k:
+            rest = [ns for ns in self.__partition_namespaces() if ns not in namespaces]
+            if rest:
+                tracer.incr("router_fallbacks")
+                matches = sorted(matches + self.__query_namespaces(rest, top_k, vector=vector),
+                                 key=lambda match: match["score"], reverse=True)[:top_k]
+        return matches
+
     def __run_reranking(self, query_text: str, matches: Dict[str, Any]) -> Dict[str, Any]:
         """Run reranking on search results"""
         docs_for_rerank = []
@@ -139,21 +292,22 @@ class VectorDB:
             match_metadata['id'] = match['id']
             docs_for_rerank.append(match_metadata)
         try:
-            reranked_docs = self.pc.inference.rerank(
-                        model="bge-reranker-v2-m3",
-                        query=query_text,
-                        documents=docs_for_rerank,
-                        top_n=3,
-                        rank_fields=["description"],
-                        return_documents=True,
-                        parameters={
-                            "truncate": "END"
-                        }
-                    )
-            logger.log_trace(f"Reranking success", level='INFO')
+            with tracer.span("vector_db.rerank", documents=len(docs_for_rerank)):
+                reranked_docs = self.pc.inference.rerank(
+                            model="bge-reranker-v2-m3",
+                            query=query_text,
+                            documents=docs_for_rerank,
+                            top_n=3,
+                            rank_fields=["description"],
+                            return_documents=True,
+                            parameters={
+                                "truncate": "END"
+                            }
+                        )
+            logger.log_trace("Reranking success", level='INFO')
             return reranked_docs
         except Exception as e:
-            logger.error(f"Error reranking search results: {e}", level='ERROR')
+            logger.log_trace("Error reranking search results: %s", e, level='ERROR')
             traceback.print_exc()
             raise e
     def __reformat_reranked_results(self, reranked_docs: List[Dict[str, Any]]) -> str:
@@ -190,6 +344,45 @@ class VectorDB:
             reformatted_str +="\n\n"
         return reformatted_str
 
+    def __remember_products(self, matches: List[Dict[str, Any]]) -> None:
+        """Keep the metadata of recommended products, so adding them to a cart needs no lookup"""
+        now = time.monotonic()
+        with self._products_lock:
+            for match in matches:
+                metadata = match["metadata"]
+                self._products[int(metadata["product_id"])] = (metadata, now)
+                self._products.move_to_end(int(metadata["product_id"]))
+            while len(self._products) > self.config.product_cache_size:
+                self._products.popitem(last=False)
+
+    def get_product(self, product_id: int) -> Optional[Dict[str, Any]]:
+        """Catalog metadata of a product, from recent recommendations or a filtered index query"""
+        with self._products_lock:
+            cached = self._products.get(int(product_id))
+        if cached is not None and time.monotonic() - cached[1] < self.config.product_cache_ttl:
+            return cached[0]
+
+        # Any non-zero vector works, the metadata filter picks the product
+        vector = [0.0] * self.config.dimension
+        vector[0] = 1.0
+        product_filter = {"product_id": {"$eq": int(product_id)}}
+        with tracer.span("vector_db.fetch_product"):
+            if self.router is not None:
+                matches = self.__query_namespaces(self.__partition_namespaces(), 1, vector=vector, filter=product_filter)
+            else:
+                results = self.index.query(
+                    vector=vector,
+                    top_k=1,
+                    filter=product_filter,
+                    include_values=False,
+                    include_metadata=True
+                )
+                matches = results["matches"]
+        if not matches:
+            return None
+        self.__remember_products(matches)
+        return matches[0]["metadata"]
+
     def get_stats(self) -> Dict[str, Any]:
         """Get index statistics"""
         return self.index.describe_index_stats()